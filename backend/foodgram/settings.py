@@ -1,4 +1,5 @@
 import os
+from datetime import datetime, timezone
 from pathlib import Path
 
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -19,11 +20,13 @@ INSTALLED_APPS = [
     'rest_framework',
     'rest_framework.authtoken',
     'corsheaders',
+    'django_filters',
     'djoser',
     'recipes',
 ]
 
 MIDDLEWARE = [
+    'recipes.middleware.PerformanceMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -59,7 +62,7 @@ CORS_ALLOW_HEADERS = [
 ]
 
 # Добавляем настройку для обработки заголовков
-CORS_EXPOSE_HEADERS = ['content-type', 'content-length']
+CORS_EXPOSE_HEADERS = ['content-type', 'content-length', 'server-timing']
 
 ROOT_URLCONF = 'foodgram.urls'
 
@@ -92,6 +95,18 @@ DATABASES = {
     }
 }
 
+# Cache: locmem by default; for production set e.g.
+# CACHE_BACKEND=django.core.cache.backends.redis.RedisCache and
+# CACHE_LOCATION=redis://redis:6379/1, or FileBasedCache with a directory.
+# Multi-process deployments need a shared backend (gunicorn_asgi.py refuses
+# to start several workers on locmem)
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
+    }
+}
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -121,6 +136,35 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Token authentication cache (recipes.authentication), shared cache only
+TOKEN_CACHE_TTL = 60
+
+# Per-user favorite / shopping cart recipe id sets (recipes.user_flags);
+# a per-user version stamp is bumped on write and the sets reload on read
+USER_FLAGS_CACHE_TTL = 600
+
+# Per-user shopping list totals (recipes.shopping_list); updated
+# incrementally on cart changes, invalidated when a recipe is edited
+SHOPPING_LIST_CACHE_TTL = 3600
+
+# Trending recipes (recipes.trending): scores decay with this half-life and
+# grow from a fixed epoch; rebuild with a later epoch within ~8 years
+TRENDING_EPOCH = datetime(2025, 1, 1, tzinfo=timezone.utc)
+TRENDING_HALF_LIFE_HOURS = 72
+TRENDING_WEIGHTS = {
+    'favorite': 1.0,
+    'shopping_cart': 2.0,
+}
+
+# Short links: shared cache only, so deleting a recipe reaches every worker
+SHORT_LINK_CACHE_TTL = 24 * 60 * 60
+
+# Uploaded images: nginx limits bodies to 10M, Base64 adds a third on top
+DATA_UPLOAD_MAX_MEMORY_SIZE = 10 * 1024 * 1024
+IMAGE_UPLOAD_MAX_SIZE = 7 * 1024 * 1024
+IMAGE_MAX_PIXELS = 40_000_000
+IMAGE_VARIANT_WIDTHS = (320, 640)
+
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 REST_FRAMEWORK = {
@@ -128,8 +172,22 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.AllowAny',
     ],
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'recipes.authentication.CachedTokenAuthentication',
+    ],
+    'DEFAULT_PAGINATION_CLASS': 'recipes.pagination.PageLimitPagination',
+    'DEFAULT_RENDERER_CLASSES': [
+        'recipes.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
     ],
+    # Число доверенных прокси перед бэкендом (nginx из infra/): IP клиента —
+    # последний адрес X-Forwarded-For, дописанный прокси, а не то, что
+    # прислал сам клиент
+    'NUM_PROXIES': int(os.getenv('NUM_PROXIES', '1')),
+    'DEFAULT_THROTTLE_RATES': {
+        # recipes.throttling.LoginRateThrottle
+        'login_ip': os.getenv('LOGIN_RATE_IP', '30/min'),
+        'login_account': os.getenv('LOGIN_RATE_ACCOUNT', '10/min'),
+    },
 }
 
 # Authentication settings
@@ -157,13 +215,14 @@ DJOSER = {
 
 AUTH_USER_MODEL = 'auth.User'
 
-# Logging configuration
+# Logging configuration: records are queued and written by a background
+# listener thread, so request threads never block on log I/O
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
     'handlers': {
         'console': {
-            'class': 'logging.StreamHandler',
+            '()': 'recipes.log.AsyncStreamHandler',
         },
     },
     'root': {
@@ -177,4 +236,24 @@ LOGGING = {
             'propagate': False,
         },
     },
-} 
\ No newline at end of file
+}
+
+# Async-view для чтения рецептов и справочников (recipes/async_views.py).
+# Только по явному включению под ASGI: на замерах bench_concurrency
+# (SQLite, 1 CPU) они медленнее WSGI, выигрыш ожидается лишь с сетевой БД
+ASYNC_READ_VIEWS = os.getenv('ASYNC_READ_VIEWS', 'False') == 'True'
+
+# Карточки рецептов в JSON из строк .values() (serializers.RecipeRowSerializer)
+RECIPE_ROW_SERIALIZER = os.getenv('RECIPE_ROW_SERIALIZER', 'False') == 'True'
+
+# Performance instrumentation (recipes.middleware.PerformanceMiddleware)
+# Server-Timing reveals query counts and timings to any client, so it is
+# on only with DEBUG unless enabled explicitly (e.g. for bench_api --url)
+SERVER_TIMING_ENABLED = os.getenv('SERVER_TIMING_ENABLED', str(DEBUG)) == 'True'
+QUERY_BUDGET_STRICT = os.getenv('QUERY_BUDGET_STRICT', 'False') == 'True'
+METRICS_ALLOWED_IPS = os.getenv('METRICS_ALLOWED_IPS', '127.0.0.1').split(',')
+
+# Ingredient autocomplete
+INGREDIENT_INDEX_IN_MEMORY = os.getenv('INGREDIENT_INDEX_IN_MEMORY', 'True') == 'True'
+INGREDIENT_INDEX_TTL = int(os.getenv('INGREDIENT_INDEX_TTL', 300))
+INGREDIENT_SEARCH_LIMIT = 50
@@ -22,7 +22,7 @@ from django.views.generic import TemplateView
 from rest_framework.routers import DefaultRouter
 from recipes.views import (
     IngredientViewSet, TagViewSet, RecipeViewSet,
-    CustomTokenCreateView, UserViewSet
+    CustomTokenCreateView, UserViewSet, metrics_view, short_link_redirect
 )
 
 router = DefaultRouter()
@@ -31,12 +31,24 @@ router.register('tags', TagViewSet)
 router.register('recipes', RecipeViewSet)
 router.register('users', UserViewSet)
 
+short_link_view = short_link_redirect
+async_patterns = []
+if settings.ASYNC_READ_VIEWS:
+    # Под ASGI чтение рецептов и справочников обслуживают async-view,
+    # остальные методы они передают тем же ViewSet
+    from recipes import async_views
+    async_patterns = async_views.urlpatterns
+    short_link_view = async_views.short_link_redirect
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/auth/token/login/', CustomTokenCreateView.as_view(), name='token_create'),
     path('api/auth/', include('djoser.urls')),
     path('api/auth/', include('djoser.urls.authtoken')),
+    path('api/metrics/', metrics_view, name='metrics'),
+    *async_patterns,
     path('api/', include(router.urls)),
+    path('s/<str:code>/', short_link_view, name='short_link'),
 ]
 
 # Добавляем обработку фронтенд-маршрутов
@@ -0,0 +1,31 @@
+# Конфигурация gunicorn для ASGI-режима:
+#   gunicorn -c gunicorn_asgi.py foodgram.asgi:application
+# Async-view чтения рецептов, тегов, ингредиентов и коротких ссылок
+# включаются отдельно переменной ASYNC_READ_VIEWS=True; без неё под ASGI
+# работают обычные ViewSet.
+import multiprocessing
+import os
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:8000')
+worker_class = 'uvicorn_worker.UvicornWorker'
+# Каждый процесс держит тысячи соединений в event loop, поэтому процессов
+# нужно по числу ядер, а не 2 * CPU + 1, как для синхронных воркеров
+workers = int(os.getenv('GUNICORN_WORKERS', multiprocessing.cpu_count()))
+backlog = 2048
+keepalive = 5
+timeout = 30
+graceful_timeout = 30
+# Соединения с БД под ASGI открываются на каждый запрос (CONN_MAX_AGE = 0):
+# постоянные соединения привязаны к потоку и под async-view не переиспользуются
+
+# Сброс токенов, флагов пользователей, версий справочников и коротких
+# ссылок должен доходить до всех воркеров, а locmem у каждого процесса свой
+CACHE_BACKEND = os.getenv(
+    'CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'
+)
+if workers > 1 and CACHE_BACKEND.endswith('.LocMemCache'):
+    raise RuntimeError(
+        'ASGI-режим с несколькими воркерами требует общего кеша: задайте '
+        'CACHE_BACKEND (например, RedisCache) и CACHE_LOCATION '
+        'или GUNICORN_WORKERS=1'
+    )
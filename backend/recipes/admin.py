@@ -1,4 +1,5 @@
 from django.contrib import admin
+from . import shopping_list
 from .models import Ingredient, Tag, Recipe, RecipeIngredient, Favorite, ShoppingCart
 
 @admin.register(Ingredient)
@@ -22,11 +23,14 @@ class RecipeAdmin(admin.ModelAdmin):
     list_display = ('name', 'author', 'favorites_count')
     search_fields = ('name', 'author__username', 'author__email')
     list_filter = ('author', 'name', 'tags')
+    readonly_fields = ('favorites_count', 'shopping_cart_count')
     inlines = [RecipeIngredientInline]
 
-    def favorites_count(self, obj):
-        return obj.favorited_by.count()
-    favorites_count.short_description = 'В избранном'
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        if change:
+            # Инлайн мог изменить ингредиенты: кеш списков покупок с рецептом
+            shopping_list.recipe_changed(form.instance.pk)
 
 @admin.register(Favorite)
 class FavoriteAdmin(admin.ModelAdmin):
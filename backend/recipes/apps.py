@@ -0,0 +1,10 @@
+from django.apps import AppConfig
+
+
+class RecipesConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'recipes'
+    verbose_name = 'Рецепты'
+
+    def ready(self):
+        from . import signals  # noqa: F401
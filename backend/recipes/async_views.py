@@ -0,0 +1,199 @@
+"""Async-версии горячих read-only эндпоинтов для запуска под ASGI.
+
+Подключаются в foodgram/urls.py при ASYNC_READ_VIEWS = True (по умолчанию
+выключено). Каждая view обслуживает только обычный JSON GET и
+отвечает так же, как соответствующий ViewSet; запись, курсорная пагинация
+и browsable API передаются самому ViewSet через sync_to_async.
+"""
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.http import Http404, HttpResponse, HttpResponseRedirect
+from django.urls import path
+from django.utils.cache import patch_vary_headers
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import exceptions
+from rest_framework.request import Request
+
+from . import autocomplete, caching, shortlinks, user_flags
+from .authentication import CachedTokenAuthentication
+from .models import Ingredient, Tag
+from .renderers import FastJSONRenderer
+from .serializers import IngredientSerializer, RecipeRowSerializer, TagSerializer
+from .views import IngredientViewSet, RecipeViewSet, TagViewSet
+
+renderer = FastJSONRenderer()
+authentication = CachedTokenAuthentication()
+
+
+class JSONResponse(HttpResponse):
+    def __init__(self, data, status=200):
+        super().__init__(
+            renderer.render(data), status=status, content_type='application/json'
+        )
+        patch_vary_headers(self, ['Accept'])
+
+
+def error_response(exc):
+    # Тот же формат, что у rest_framework.views.exception_handler
+    if isinstance(exc.detail, (list, dict)):
+        data = exc.detail
+    else:
+        data = {'detail': exc.detail}
+    response = JSONResponse(data, status=exc.status_code)
+    if isinstance(exc, (exceptions.NotAuthenticated, exceptions.AuthenticationFailed)):
+        response['WWW-Authenticate'] = authentication.authenticate_header(None)
+    return response
+
+
+def async_read(viewset, actions, fallback_params=()):
+    """Async-обработчик GET с передачей остальных запросов ``viewset``.
+
+    Обработчик получает аутентифицированного пользователя. Атрибуты
+    cls/actions — как у ViewSet.as_view: по ним PerformanceMiddleware
+    находит query_budget.
+    """
+    sync_view = sync_to_async(viewset.as_view(actions))
+
+    def decorator(handler):
+        async def view(request, *args, **kwargs):
+            if (
+                request.method != 'GET'
+                or 'text/html' in request.headers.get('Accept', '')
+                or any(param in request.GET for param in ('format', *fallback_params))
+            ):
+                return await sync_view(request, *args, **kwargs)
+            try:
+                result = await authentication.aauthenticate(request)
+                user = result[0] if result else AnonymousUser()
+                return await handler(request, user, *args, **kwargs)
+            except exceptions.APIException as exc:
+                return error_response(exc)
+
+        view = csrf_exempt(view)
+        view.cls = viewset
+        view.actions = actions
+        return view
+
+    return decorator
+
+
+async def aget_or_404(queryset, **kwargs):
+    try:
+        return await queryset.aget(**kwargs)
+    except queryset.model.DoesNotExist:
+        # Текст как у get_object_or_404, который использует ViewSet
+        raise exceptions.NotFound(
+            f'No {queryset.model._meta.object_name} matches the given query.'
+        )
+
+
+async def reference_response(request, group, build):
+    # Асинхронный аналог caching.CachedResponseMixin с теми же ключами и ETag
+    version = await caching.aget_version(group)
+    key = caching.response_key(group, version, request, 'json')
+    entry = await cache.aget(key)
+    if entry is None:
+        entry = caching.make_entry(await build(), 'json')
+        await cache.aset(key, entry)
+    return caching.conditional_response(request, entry, version, JSONResponse)
+
+
+def viewset_for(viewset, request, user, action):
+    # Экземпляр ViewSet даёт async-view те же get_queryset, фильтры,
+    # пагинатор и сериализатор, что и синхронный путь; отвечают они только
+    # JSON, поэтому рендерер известен заранее
+    drf_request = Request(request)
+    drf_request.user = user
+    drf_request.accepted_renderer = renderer
+    return viewset(
+        request=drf_request, action=action, format_kwarg=None, args=(), kwargs={}
+    )
+
+
+async def serialize_recipes(view, instance, many=False):
+    # Сериализатор читает флаги из запроса, синхронно загружать их нельзя
+    await user_flags.afor_request(view.request)
+    serializer = view.get_serializer(instance, many=many)
+    if isinstance(serializer, RecipeRowSerializer):
+        await serializer.aload()
+    return serializer.data
+
+
+@async_read(RecipeViewSet, {'get': 'list', 'post': 'create'}, fallback_params=('cursor',))
+async def recipe_list(request, user):
+    view = viewset_for(RecipeViewSet, request, user, 'list')
+    queryset = view.get_queryset()
+    # Только фильтр по slug тегов проверяет значения запросом к БД
+    if 'tags' in request.GET:
+        queryset = await sync_to_async(view.filter_queryset)(queryset)
+    else:
+        queryset = view.filter_queryset(queryset)
+    page = await view.paginator.apaginate_queryset(queryset, view.request, view)
+    data = await serialize_recipes(view, page, many=True)
+    return JSONResponse(view.get_paginated_response(data).data)
+
+
+@async_read(RecipeViewSet, {
+    'get': 'retrieve', 'put': 'update',
+    'patch': 'partial_update', 'delete': 'destroy',
+})
+async def recipe_detail(request, user, pk):
+    view = viewset_for(RecipeViewSet, request, user, 'retrieve')
+    recipe = await aget_or_404(view.get_queryset(), pk=pk)
+    return JSONResponse(await serialize_recipes(view, recipe))
+
+
+@async_read(IngredientViewSet, {'get': 'list'})
+async def ingredient_list(request, user):
+    name = request.GET.get('name')
+    if name:
+        # Как IngredientViewSet.list: поиск по индексу в памяти без кеша
+        # ответов, иначе каждый набранный префикс занимал бы ключ в кеше
+        ingredients = await sync_to_async(autocomplete.search)(name)
+        return JSONResponse(IngredientSerializer(ingredients, many=True).data)
+
+    async def build():
+        ingredients = [item async for item in Ingredient.objects.all()]
+        return IngredientSerializer(ingredients, many=True).data
+    return await reference_response(request, 'ingredients', build)
+
+
+@async_read(IngredientViewSet, {'get': 'retrieve'})
+async def ingredient_detail(request, user, pk):
+    async def build():
+        ingredient = await aget_or_404(Ingredient.objects.all(), pk=pk)
+        return IngredientSerializer(ingredient).data
+    return await reference_response(request, 'ingredients', build)
+
+
+@async_read(TagViewSet, {'get': 'list'})
+async def tag_list(request, user):
+    async def build():
+        return TagSerializer([tag async for tag in Tag.objects.all()], many=True).data
+    return await reference_response(request, 'tags', build)
+
+
+@async_read(TagViewSet, {'get': 'retrieve'})
+async def tag_detail(request, user, pk):
+    async def build():
+        return TagSerializer(await aget_or_404(Tag.objects.all(), pk=pk)).data
+    return await reference_response(request, 'tags', build)
+
+
+async def short_link_redirect(request, code):
+    target = await shortlinks.aresolve(code)
+    if target is None:
+        raise Http404('Рецепт не найден.')
+    return HttpResponseRedirect(target)
+
+
+# Имена совпадают с маршрутами DefaultRouter, чтобы метрики не расходились
+urlpatterns = [
+    path('api/recipes/', recipe_list, name='recipe-list'),
+    path('api/recipes/<int:pk>/', recipe_detail, name='recipe-detail'),
+    path('api/ingredients/', ingredient_list, name='ingredient-list'),
+    path('api/ingredients/<int:pk>/', ingredient_detail, name='ingredient-detail'),
+    path('api/tags/', tag_list, name='tag-list'),
+    path('api/tags/<int:pk>/', tag_detail, name='tag-detail'),
+]
@@ -1,18 +1,38 @@
 from django.contrib.auth.backends import ModelBackend
 from django.contrib.auth import get_user_model
-from django.db.models import Q
 
 User = get_user_model()
 
+
+def get_user_by_email(email):
+    # Один запрос без учёта регистра; на Postgres использует индекс
+    # по UPPER(email) из миграции recipes 0007
+    return User.objects.filter(email__iexact=email).order_by('pk').first()
+
+
+def authenticate_by_email(email, password):
+    # Данные могут прийти из произвольного JSON, а не только из формы
+    if not isinstance(email, str) or not isinstance(password, str):
+        return None
+    user = get_user_by_email(email)
+    if user is None:
+        # Хешируем пароль и для несуществующего email, чтобы время ответа
+        # не выдавало, зарегистрирован ли адрес
+        User().set_password(password)
+        return None
+    if user.check_password(password):
+        return user
+    return None
+
+
 class EmailBackend(ModelBackend):
     def authenticate(self, request, username=None, password=None, **kwargs):
-        try:
-            # Ищем пользователя по email (который передается в username)
-            user = User.objects.get(email=username)
-        except User.DoesNotExist:
+        # Ищем пользователя по email (который передается в username)
+        email = kwargs.get('email', username)
+        if email is None or password is None:
             return None
-
-        if user.check_password(password):
+        user = authenticate_by_email(email, password)
+        if user is not None and self.user_can_authenticate(user):
             return user
         return None
 
@@ -20,4 +40,4 @@ class EmailBackend(ModelBackend):
         try:
             return User.objects.get(pk=user_id)
         except User.DoesNotExist:
-            return None 
\ No newline at end of file
+            return None
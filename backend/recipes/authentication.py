@@ -0,0 +1,101 @@
+import threading
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+
+CACHE_KEY = 'authtoken:{key}'
+
+
+class CacheStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = dict.fromkeys(('hits', 'misses'), 0)
+
+    def incr(self, name):
+        with self.lock:
+            self.counters[name] += 1
+
+    def snapshot(self):
+        with self.lock:
+            counters = dict(self.counters)
+        total = sum(counters.values())
+        counters['hit_ratio'] = counters['hits'] / total if total else 0.0
+        return counters
+
+
+stats = CacheStats()
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication, не обращающийся к БД при попадании в кеш.
+
+    В кеше лежат только ключ, id пользователя и is_active (не дольше
+    TOKEN_CACHE_TTL секунд): по ним собирается пользователь с отложенными
+    остальными полями, так что хеш пароля и персональные данные в кеш не
+    попадают. Сигналы сбрасывают запись при удалении токена (logout) и
+    изменении пользователя; другие воркеры увидят сброс только при общем
+    бэкенде CACHES, поэтому locmem годится лишь для одного процесса.
+    """
+
+    def authenticate_credentials(self, key):
+        entry = cache.get(CACHE_KEY.format(key=key))
+        if entry is None:
+            return self.check_user(self.load_token(key))
+        stats.incr('hits')
+        return self.check_user(self.build_token(entry))
+
+    async def aauthenticate(self, request):
+        # Вариант для async-view (recipes.async_views): заголовок разбирает
+        # TokenAuthentication, промах кеша — тот же load_token в потоке
+        key = TokenKey().authenticate(request)
+        if key is None:
+            return None
+        entry = await cache.aget(CACHE_KEY.format(key=key))
+        if entry is None:
+            return self.check_user(await sync_to_async(self.load_token)(key))
+        stats.incr('hits')
+        return self.check_user(self.build_token(entry))
+
+    def load_token(self, key):
+        stats.incr('misses')
+        model = self.get_model()
+        try:
+            token = model.objects.select_related('user').get(key=key)
+        except model.DoesNotExist:
+            raise exceptions.AuthenticationFailed('Недействительный токен.')
+        entry = {
+            'key': token.key, 'user_id': token.user_id,
+            'is_active': token.user.is_active,
+        }
+        cache.set(CACHE_KEY.format(key=key), entry, timeout=settings.TOKEN_CACHE_TTL)
+        return token
+
+    def build_token(self, entry):
+        # Остальные поля пользователя догружаются из БД при первом обращении
+        user_model = get_user_model()
+        user = user_model.from_db(
+            None, [user_model._meta.pk.attname, 'is_active'],
+            (entry['user_id'], entry['is_active']),
+        )
+        return self.get_model()(key=entry['key'], user=user)
+
+    @staticmethod
+    def check_user(token):
+        if not token.user.is_active:
+            raise exceptions.AuthenticationFailed('Пользователь деактивирован.')
+        return token.user, token
+
+
+class TokenKey(TokenAuthentication):
+    # authenticate() возвращает ключ из заголовка Authorization (или None)
+    # с теми же ошибками разбора, что у TokenAuthentication
+    def authenticate_credentials(self, key):
+        return key
+
+
+def forget_token(key):
+    cache.delete(CACHE_KEY.format(key=key))
@@ -0,0 +1,96 @@
+import threading
+import time
+from bisect import bisect_left
+
+from django.conf import settings
+from django.db.models import Case, IntegerField, Value, When
+
+from .caching import get_version
+from .models import Ingredient
+
+
+def normalize(value):
+    return value.casefold().strip()
+
+
+class IngredientIndex:
+    """Отсортированный по ключу снимок ингредиентов для поиска по префиксу."""
+
+    def __init__(self, ingredients, version=None):
+        self.items = sorted(ingredients, key=lambda item: normalize(item.name))
+        self.keys = [normalize(item.name) for item in self.items]
+        self.built_at = time.monotonic()
+        self.version = version
+
+    @classmethod
+    def build(cls, version=None):
+        return cls(Ingredient.objects.only('id', 'name', 'measurement_unit'), version)
+
+    def search(self, query, limit):
+        query = normalize(query)
+        if not query:
+            return self.items[:limit]
+        start = bisect_left(self.keys, query)
+        end = bisect_left(self.keys, query + '\U0010ffff', lo=start)
+        result = self.items[start:min(end, start + limit)]
+        if len(result) >= limit:
+            return result
+        # Затем — вхождения в середине названия
+        for position, key in enumerate(self.keys):
+            if start <= position < end or query not in key:
+                continue
+            result.append(self.items[position])
+            if len(result) >= limit:
+                break
+        return result
+
+
+_index = None
+_lock = threading.Lock()
+
+
+def get_index():
+    # Индекс помнит версию справочника из общего кеша (caching.get_version):
+    # изменение ингредиентов в любом процессе меняет её после коммита, и
+    # индекс перестраивается при следующем поиске во всех воркерах
+    global _index
+    version = get_version('ingredients')
+    index = _index
+    ttl = getattr(settings, 'INGREDIENT_INDEX_TTL', 300)
+    if (
+        index is None or index.version != version
+        or time.monotonic() - index.built_at > ttl
+    ):
+        with _lock:
+            if _index is None or _index is index:
+                _index = IngredientIndex.build(version)
+            index = _index
+    return index
+
+
+def invalidate_index(**kwargs):
+    global _index
+    _index = None
+
+
+def search_db(query, limit):
+    # Используется без in-memory индекса; на Postgres опирается на
+    # функциональный и триграммный индексы по UPPER(name)
+    return (
+        Ingredient.objects
+        .filter(name__icontains=query)
+        .annotate(rank=Case(
+            When(name__istartswith=query, then=Value(0)),
+            default=Value(1),
+            output_field=IntegerField(),
+        ))
+        .order_by('rank', 'name')[:limit]
+    )
+
+
+def search(query, limit=None):
+    if limit is None:
+        limit = getattr(settings, 'INGREDIENT_SEARCH_LIMIT', 50)
+    if getattr(settings, 'INGREDIENT_INDEX_IN_MEMORY', True):
+        return get_index().search(query, limit)
+    return list(search_db(query, limit))
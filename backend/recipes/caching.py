@@ -0,0 +1,92 @@
+import hashlib
+import json
+import time
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
+from rest_framework.response import Response
+
+VERSION_KEY = 'refdata:{group}:version'
+RESPONSE_KEY = 'refdata:{group}:{version}:{format}:{path}'
+
+
+def get_version(group):
+    version = cache.get(VERSION_KEY.format(group=group))
+    if version is None:
+        # После вытеснения ключа версия начинается заново от текущего времени
+        version = bump_version(group)
+    return version
+
+
+def bump_version(group):
+    version = time.time_ns()
+    cache.set(VERSION_KEY.format(group=group), version, timeout=None)
+    return version
+
+
+async def aget_version(group):
+    # get_version для async-view: промах редок, его обрабатывает тот же
+    # bump_version в потоке, а не своя копия
+    version = await cache.aget(VERSION_KEY.format(group=group))
+    if version is None:
+        version = await sync_to_async(bump_version)(group)
+    return version
+
+
+def response_key(group, version, request, format):
+    # JSON и browsable API по одному адресу — разные ответы
+    path_hash = hashlib.md5(request.get_full_path().encode()).hexdigest()
+    return RESPONSE_KEY.format(
+        group=group, version=version, format=format, path=path_hash
+    )
+
+
+def make_entry(data, format):
+    content = json.dumps(data, ensure_ascii=False, sort_keys=True).encode()
+    etag = hashlib.md5(format.encode() + b':' + content).hexdigest()
+    return {'data': data, 'etag': f'"{etag}"'}
+
+
+def conditional_response(request, entry, version, response_class):
+    """304 или ответ ``response_class(data)`` с заголовками валидации."""
+    last_modified = version // 1_000_000_000
+    not_modified = get_conditional_response(
+        request, etag=entry['etag'], last_modified=last_modified
+    )
+    response = not_modified or response_class(entry['data'])
+    response['ETag'] = entry['etag']
+    response['Last-Modified'] = http_date(last_modified)
+    response['Cache-Control'] = 'no-cache'
+    patch_vary_headers(response, ['Accept'])
+    return response
+
+
+class CachedResponseMixin:
+    """Кеширует ответы list/retrieve справочника до смены его версии.
+
+    Версию группы ``cache_group`` повышают сигналы после коммита изменений
+    моделей, поэтому устаревшие ответы просто перестают запрашиваться.
+    """
+
+    cache_group = None
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(request, super().list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(request, super().retrieve, *args, **kwargs)
+
+    def cached_response(self, request, build, *args, **kwargs):
+        version = get_version(self.cache_group)
+        format = request.accepted_renderer.format
+        key = response_key(self.cache_group, version, request, format)
+        entry = cache.get(key)
+        if entry is None:
+            response = build(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+            entry = make_entry(response.data, format)
+            cache.set(key, entry)
+        return conditional_response(request, entry, version, Response)
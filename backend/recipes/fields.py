@@ -0,0 +1,87 @@
+import base64
+import binascii
+import hashlib
+import re
+import tempfile
+
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.utils.functional import cached_property
+from PIL import Image
+from rest_framework import serializers
+
+DATA_URI_RE = re.compile(r'^data:image/(?P<ext>[a-z0-9.+-]+);base64,')
+# Кратно 4 символам Base64, чтобы каждый кусок декодировался независимо
+CHUNK_SIZE = 64 * 1024
+
+
+class Base64ImageField(serializers.ImageField):
+    """Принимает картинку как data URI (``data:image/png;base64,...``).
+
+    Данные декодируются кусками во временный файл с одновременным
+    подсчётом sha256: одинаковые загрузки получают одно имя и хранятся
+    один раз. Каталог и хранилище берутся из поля модели, к которому
+    привязан сериализатор.
+    """
+
+    default_error_messages = {
+        **serializers.ImageField.default_error_messages,
+        'invalid_base64': 'Некорректное изображение в формате Base64.',
+        'too_large': 'Размер изображения не должен превышать {max_size} байт.',
+        'too_many_pixels': 'Слишком большое разрешение изображения.',
+    }
+
+    @cached_property
+    def model_field(self):
+        return self.parent.Meta.model._meta.get_field(self.source)
+
+    def to_internal_value(self, data):
+        if not isinstance(data, str):
+            return super().to_internal_value(data)
+        match = DATA_URI_RE.match(data)
+        if match is None:
+            self.fail('invalid_base64')
+        start = match.end()
+        max_size = settings.IMAGE_UPLOAD_MAX_SIZE
+        # Размер оценивается по длине строки до декодирования
+        if (len(data) - start) * 3 // 4 > max_size + 2:
+            self.fail('too_large', max_size=max_size)
+
+        file = tempfile.SpooledTemporaryFile(max_size=1024 * 1024)
+        digest = hashlib.sha256()
+        try:
+            for offset in range(start, len(data), CHUNK_SIZE):
+                chunk = base64.b64decode(
+                    data[offset:offset + CHUNK_SIZE], validate=True
+                )
+                digest.update(chunk)
+                file.write(chunk)
+        except (binascii.Error, ValueError):
+            file.close()
+            self.fail('invalid_base64')
+        size = file.tell()
+        file.seek(0)
+
+        # Image.open читает только заголовок, пиксели не декодируются
+        try:
+            with Image.open(file) as image:
+                width, height = image.size
+                extension = (image.format or match['ext']).lower()
+        except Exception:
+            file.close()
+            self.fail('invalid_image')
+        if width * height > settings.IMAGE_MAX_PIXELS:
+            file.close()
+            self.fail('too_many_pixels')
+        file.seek(0)
+
+        name = f'{digest.hexdigest()}.{extension.replace("jpeg", "jpg")}'
+        path = self.model_field.generate_filename(None, name)
+        if self.model_field.storage.exists(path):
+            # Такой файл уже загружен — ссылаемся на него без повторной записи
+            file.close()
+            return path
+        uploaded = UploadedFile(
+            file, name=name, content_type=f'image/{extension}', size=size
+        )
+        return super().to_internal_value(uploaded)
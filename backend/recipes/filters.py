@@ -0,0 +1,64 @@
+from django import forms
+from django.db.models import Exists, OuterRef
+from django_filters import rest_framework as filters
+
+from . import search
+from .models import Favorite, Recipe, ShoppingCart, Tag
+
+
+class IdFilter(filters.NumberFilter):
+    # Целый id в пределах BIGINT: переполнение даёт 400, а не ошибку БД
+    field_class = forms.IntegerField
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('min_value', 1)
+        kwargs.setdefault('max_value', 2**63 - 1)
+        super().__init__(*args, **kwargs)
+
+
+class RecipeFilter(filters.FilterSet):
+    # Все условия — EXISTS-подзапросы: JOIN по тегам или избранному
+    # размножал бы строки и требовал DISTINCT
+    tags = filters.ModelMultipleChoiceFilter(
+        queryset=Tag.objects.all(),
+        field_name='tags__slug',
+        to_field_name='slug',
+        method='filter_tags',
+    )
+    author = IdFilter(field_name='author_id')
+    is_favorited = filters.NumberFilter(method='filter_user_relation')
+    is_in_shopping_cart = filters.NumberFilter(method='filter_user_relation')
+    search = filters.CharFilter(method='filter_search')
+
+    RELATIONS = {
+        'is_favorited': Favorite,
+        'is_in_shopping_cart': ShoppingCart,
+    }
+
+    class Meta:
+        model = Recipe
+        fields = ('tags', 'author', 'is_favorited', 'is_in_shopping_cart', 'search')
+
+    def filter_tags(self, queryset, name, value):
+        if not value:
+            return queryset
+        return queryset.filter(Exists(
+            Recipe.tags.through.objects.filter(
+                recipe=OuterRef('pk'), tag__in=value
+            )
+        ))
+
+    def filter_user_relation(self, queryset, name, value):
+        # По схеме API 0 означает «без ограничения», 1 — только отмеченные
+        if value != 1:
+            return queryset
+        user = self.request.user
+        if not user.is_authenticated:
+            return queryset.none()
+        return queryset.filter(Exists(
+            self.RELATIONS[name].objects.filter(user=user, recipe=OuterRef('pk'))
+        ))
+
+    def filter_search(self, queryset, name, value):
+        # Полнотекстовый поиск с сортировкой по релевантности
+        return search.search(queryset, value)
@@ -0,0 +1,44 @@
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+# Один фоновый поток: обработка изображений не должна конкурировать
+# с запросами за CPU, а очередь переживает всплески загрузок
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='image-variants')
+
+
+def variant_name(name, width):
+    root, _ = os.path.splitext(name)
+    directory, filename = os.path.split(root)
+    return os.path.join(directory, 'variants', f'{filename}_{width}.webp')
+
+
+def make_variants(name):
+    close_old_connections()
+    try:
+        with default_storage.open(name) as file, Image.open(file) as image:
+            image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+            for width in settings.IMAGE_VARIANT_WIDTHS:
+                target = variant_name(name, width)
+                if default_storage.exists(target):
+                    continue
+                variant = image.copy()
+                variant.thumbnail((width, width * 4))
+                content = ContentFile(b'')
+                variant.save(content, format='WEBP', quality=80)
+                default_storage.save(target, content)
+    except Exception:
+        logger.exception('Не удалось подготовить варианты изображения %s', name)
+
+
+def schedule_variants(name):
+    if name:
+        return _executor.submit(make_variants, name)
@@ -0,0 +1,41 @@
+import atexit
+import json
+import logging
+import queue
+from logging.handlers import QueueHandler, QueueListener
+
+
+class JsonFormatter(logging.Formatter):
+    """Одна JSON-строка на запись; поля из ``extra`` попадают в объект."""
+
+    RESERVED = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime'}
+
+    def format(self, record):
+        payload = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        payload.update(
+            (key, value) for key, value in vars(record).items()
+            if key not in self.RESERVED
+        )
+        if record.exc_info:
+            payload['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+class AsyncStreamHandler(QueueHandler):
+    """Кладёт записи в очередь; вывод в поток делает фоновый QueueListener.
+
+    Поток запроса не ждёт ввода-вывода логов.
+    """
+
+    def __init__(self, formatter=None):
+        super().__init__(queue.SimpleQueue())
+        stream_handler = logging.StreamHandler()
+        stream_handler.setFormatter(formatter or JsonFormatter())
+        self.listener = QueueListener(self.queue, stream_handler)
+        self.listener.start()
+        atexit.register(self.listener.stop)
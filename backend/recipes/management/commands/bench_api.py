@@ -0,0 +1,383 @@
+import json
+import logging
+import re
+import statistics
+import time
+import urllib.error
+import urllib.request
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Count
+from django.test import Client
+from rest_framework.authtoken.models import Token
+
+from recipes import shopping_list, user_flags
+from recipes.authentication import forget_token
+from recipes.models import Ingredient, Recipe
+from recipes.throttling import LoginRateThrottle
+
+User = get_user_model()
+
+DEFAULT_COLLECTION = (
+    settings.BASE_DIR.parent / 'postman_collection' / 'foodgram.postman_collection.json'
+)
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+VARIABLE_RE = re.compile(r'{{(\w+)}}')
+QUERIES_RE = re.compile(r'desc="(\d+) queries"')
+# Относительное ухудшение p50/p95, которое считается регрессией
+REGRESSION_THRESHOLD = 0.10
+# Адрес тестового клиента, по которому LoginRateThrottle считает попытки
+CLIENT_IP = '127.0.0.1'
+
+
+def flatten(items, auth=None):
+    """Разворачивает папки коллекции; auth наследуется от ближайшего родителя."""
+    for item in items:
+        item_auth = item.get('auth', auth)
+        if 'item' in item:
+            yield from flatten(item['item'], item_auth)
+        else:
+            yield item, item['request'].get('auth', item_auth)
+
+
+def auth_token_variable(auth):
+    if not auth or auth.get('type') != 'apikey':
+        return None
+    values = {entry['key']: entry['value'] for entry in auth['apikey']}
+    match = VARIABLE_RE.search(values.get('value', ''))
+    return match.group(1) if match else None
+
+
+def percentile(values, q):
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method='inclusive')[q - 1]
+
+
+class Command(BaseCommand):
+    help = (
+        'Прогоняет запросы postman-коллекции на заполненной базе и выводит '
+        'p50/p95/p99, пропускную способность и число SQL-запросов по каждому '
+        'эндпоинту. Данные — load_test_data --users ... --recipes ....'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--collection', default=str(DEFAULT_COLLECTION))
+        parser.add_argument('--repeat', type=int, default=50)
+        parser.add_argument('--warmup', type=int, default=2)
+        parser.add_argument(
+            '--url',
+            help='Адрес запущенного сервера (gunicorn); без него запросы идут '
+                 'через тестовый клиент Django в этом процессе',
+        )
+        parser.add_argument('--concurrency', type=int, default=1)
+        parser.add_argument(
+            '--writes', action='store_true',
+            help='Добавить изменяющие запросы; каждый откатывается в транзакции '
+                 '(только без --url)',
+        )
+        parser.add_argument('--filter', default='', help='Подстрока пути')
+        parser.add_argument('--save', help='Сохранить результаты в JSON')
+        parser.add_argument('--compare', help='Сравнить с сохранённым JSON')
+
+    def handle(self, *args, **options):
+        if options['writes'] and options['url']:
+            raise CommandError('--writes работает только с тестовым клиентом')
+        if not Recipe.objects.exists():
+            raise CommandError('Нет рецептов, сначала выполните load_test_data.')
+
+        variables = self.dataset_variables(options['collection'])
+        scenarios, skipped = self.load_scenarios(options, variables)
+        if not scenarios:
+            raise CommandError('Не найдено ни одного подходящего запроса.')
+        self.stdout.write(
+            f'Рецептов: {Recipe.objects.count()}, сценариев: {len(scenarios)}, '
+            f'пропущено: {len(skipped)}'
+        )
+        for name in skipped:
+            self.stdout.write(f'  пропущен {name}')
+
+        # Ожидаемые 4xx из сценариев коллекции не должны засорять вывод
+        logging.getLogger('django.request').setLevel(logging.ERROR)
+        if options['url']:
+            send = self.http_sender(options['url'].rstrip('/'))
+        else:
+            send = self.client_sender()
+
+        for scenario in scenarios:
+            for _ in range(options['warmup']):
+                send(scenario)
+        results, elapsed = self.run(scenarios, send, options)
+        report = self.summarize(results, elapsed, options)
+        self.print_report(report)
+
+        if options['compare']:
+            with open(options['compare'], encoding='utf-8') as file:
+                self.print_comparison(json.load(file), report)
+        if options['save']:
+            with open(options['save'], 'w', encoding='utf-8') as file:
+                json.dump(report, file, ensure_ascii=False, indent=2)
+            self.stdout.write(f'Результаты сохранены в {options["save"]}')
+
+    def dataset_variables(self, collection_path):
+        """Подставляет в переменные коллекции объекты из заполненной базы.
+
+        «Первый» пользователь — с самым большим списком покупок, «второй» —
+        автор с наибольшим числом рецептов: так сценарии фильтров, подписок
+        и выгрузки списка покупок нагружены реальными данными.
+        """
+        try:
+            with open(collection_path, encoding='utf-8') as file:
+                self.collection = json.load(file)
+        except OSError as error:
+            raise CommandError(f'Не удалось открыть коллекцию: {error}')
+        variables = {
+            entry['key']: entry['value']
+            for entry in self.collection.get('variable', [])
+        }
+
+        user = User.objects.annotate(
+            total=Count('shopping_cart')
+        ).order_by('-total', 'id').first()
+        authors = User.objects.exclude(pk=user.pk).annotate(
+            total=Count('recipes')
+        ).order_by('-total', 'id')[:2]
+        second_user, third_user = (list(authors) + [user, user])[:2]
+        self.user_ids = {user.pk, second_user.pk, third_user.pk}
+        variables.update(
+            userId=user.pk,
+            secondUserId=second_user.pk,
+            thirdUserId=third_user.pk,
+            userToken=Token.objects.get_or_create(user=user)[0].key,
+            secondUserToken=Token.objects.get_or_create(user=second_user)[0].key,
+        )
+        ordinals = ('first', 'second', 'third', 'fourth', 'fifth')
+        recipe_ids = Recipe.objects.values_list('pk', flat=True)[:len(ordinals)]
+        for ordinal, pk in zip(ordinals, recipe_ids):
+            variables[f'{ordinal}RecipeId'] = pk
+        ingredients = list(Ingredient.objects.order_by('id')[:2])
+        # Опечатки в именах переменных — как в самой коллекции
+        for ordinal, ingredient in zip(ordinals, ingredients):
+            variables[f'{ordinal}IndredientId'] = ingredient.pk
+        if ingredients:
+            variables['ingredientNameFirstLatter'] = ingredients[0].name[:1]
+        return {key: str(value) for key, value in variables.items()}
+
+    def load_scenarios(self, options, variables):
+        scenarios = []
+        skipped = []
+        bodies = defaultdict(list)
+
+        def substitute(text):
+            return VARIABLE_RE.sub(lambda m: variables.get(m.group(1), m.group(0)), text)
+
+        for item, auth in flatten(self.collection['item'], self.collection.get('auth')):
+            request = item['request']
+            method = request['method']
+            raw_url = request['url']['raw'].replace('{{baseUrl}}', '')
+            if options['filter'] not in raw_url:
+                continue
+            if method not in SAFE_METHODS and not options['writes']:
+                continue
+            token_variable = auth_token_variable(auth)
+            body = request.get('body', {}).get('raw', '')
+            path = substitute(raw_url)
+            body = substitute(body)
+            token = variables.get(token_variable) if token_variable else None
+            if VARIABLE_RE.search(path + body) or (token_variable and token is None):
+                skipped.append(f'{method} {raw_url} ({item["name"].strip()})')
+                continue
+            name = f'{method} {raw_url} [{"token" if token else "anon"}]'
+            # Повторяющиеся в коллекции запросы замеряются один раз, а запросы
+            # с одним адресом, но разным телом — под отдельными номерами
+            body = body.encode()
+            if body in bodies[name]:
+                continue
+            bodies[name].append(body)
+            if len(bodies[name]) > 1:
+                name = f'{name} #{len(bodies[name])}'
+            scenarios.append({
+                'name': name, 'method': method, 'path': path,
+                'body': body, 'token': token,
+            })
+        return scenarios, skipped
+
+    def client_sender(self):
+        client = Client(HTTP_HOST=settings.ALLOWED_HOSTS[0], REMOTE_ADDR=CLIENT_IP)
+        counter = {'queries': 0}
+
+        def count_queries(execute, sql, params, many, context):
+            counter['queries'] += 1
+            return execute(sql, params, many, context)
+
+        def send(scenario):
+            extra = {}
+            if scenario['token']:
+                extra['HTTP_AUTHORIZATION'] = f'Token {scenario["token"]}'
+            counter['queries'] = 0
+            started = time.perf_counter()
+            # Изменяющие запросы откатываются, чтобы прогоны были повторяемыми
+            rollback = scenario['method'] not in SAFE_METHODS
+            atomic = transaction.atomic() if rollback else nullcontext()
+            with connection.execute_wrapper(count_queries), atomic:
+                response = client.generic(
+                    scenario['method'], scenario['path'], scenario['body'],
+                    content_type='application/json', **extra,
+                )
+                if response.streaming:
+                    b''.join(response.streaming_content)
+                if rollback:
+                    transaction.set_rollback(True)
+            elapsed = time.perf_counter() - started
+            if rollback:
+                self.forget_cached()
+                self.forget_throttle(scenario)
+            return elapsed, response.status_code, counter['queries']
+
+        return send
+
+    def forget_cached(self):
+        # Откат не касается кеша: флаги, суммы списка покупок и токены,
+        # закешированные внутри откаченного запроса, описывают несуществующие
+        # строки и сбрасываются для всех пользователей сценариев
+        user_flags.forget(self.user_ids)
+        shopping_list.forget(self.user_ids)
+        for key in Token.objects.filter(
+            user_id__in=self.user_ids
+        ).values_list('key', flat=True):
+            forget_token(key)
+
+    def forget_throttle(self, scenario):
+        # Откаченные попытки входа не должны копить лимит LoginRateThrottle:
+        # иначе после нескольких повторов сценарий входа получает 429
+        try:
+            email = json.loads(scenario['body']).get('email')
+        except (ValueError, AttributeError):
+            email = None
+        LoginRateThrottle().reset(
+            ip=CLIENT_IP, email=email if isinstance(email, str) else None
+        )
+
+    def http_sender(self, base_url):
+        def send(scenario):
+            request = urllib.request.Request(
+                base_url + scenario['path'], method=scenario['method'],
+                data=scenario['body'] or None,
+                headers={'Content-Type': 'application/json'},
+            )
+            if scenario['token']:
+                request.add_header('Authorization', f'Token {scenario["token"]}')
+            started = time.perf_counter()
+            try:
+                with urllib.request.urlopen(request) as response:
+                    response.read()
+                    status, headers = response.status, response.headers
+            except urllib.error.HTTPError as error:
+                error.read()
+                status, headers = error.code, error.headers
+            # Число запросов к БД сервер сообщает в Server-Timing; без DEBUG
+            # заголовок нужно включить SERVER_TIMING_ENABLED=True
+            match = QUERIES_RE.search(headers.get('Server-Timing', ''))
+            return (time.perf_counter() - started, status,
+                    int(match.group(1)) if match else None)
+
+        return send
+
+    def run(self, scenarios, send, options):
+        def worker(_):
+            samples = []
+            for _ in range(options['repeat']):
+                for scenario in scenarios:
+                    samples.append((scenario['name'], *send(scenario)))
+            return samples
+
+        results = defaultdict(list)
+        started = time.perf_counter()
+        if options['url'] and options['concurrency'] > 1:
+            with ThreadPoolExecutor(options['concurrency']) as executor:
+                batches = list(executor.map(worker, range(options['concurrency'])))
+        else:
+            batches = [worker(0)]
+        elapsed = time.perf_counter() - started
+        for samples in batches:
+            for name, duration, status, queries in samples:
+                results[name].append((duration, status, queries))
+        return results, elapsed
+
+    def summarize(self, results, elapsed, options):
+        endpoints = {}
+        total = 0
+        for name, samples in results.items():
+            timings = sorted(duration * 1000 for duration, _, _ in samples)
+            queries = [q for _, _, q in samples if q is not None]
+            statuses = defaultdict(int)
+            for _, status, _ in samples:
+                statuses[str(status)] += 1
+            total += len(samples)
+            endpoints[name] = {
+                'requests': len(samples),
+                'p50': round(percentile(timings, 50), 3),
+                'p95': round(percentile(timings, 95), 3),
+                'p99': round(percentile(timings, 99), 3),
+                'rps': round(len(samples) / (sum(timings) / 1000), 1),
+                'queries': max(queries) if queries else None,
+                'statuses': dict(statuses),
+            }
+        return {
+            'mode': 'http' if options['url'] else 'client',
+            'concurrency': options['concurrency'] if options['url'] else 1,
+            'repeat': options['repeat'],
+            'recipes': Recipe.objects.count(),
+            'requests': total,
+            'elapsed': round(elapsed, 3),
+            'rps': round(total / elapsed, 1),
+            'endpoints': endpoints,
+        }
+
+    def print_report(self, report):
+        self.stdout.write(
+            f'{"эндпоинт":<64} {"p50":>8} {"p95":>8} {"p99":>8} '
+            f'{"rps":>8} {"SQL":>4}  статусы'
+        )
+        for name, stats in sorted(report['endpoints'].items()):
+            statuses = ','.join(f'{code}×{n}' for code, n in stats['statuses'].items())
+            queries = '-' if stats['queries'] is None else stats['queries']
+            self.stdout.write(
+                f'{name[:64]:<64} {stats["p50"]:8.2f} {stats["p95"]:8.2f} '
+                f'{stats["p99"]:8.2f} {stats["rps"]:8.1f} {queries:>4}  {statuses}'
+            )
+        self.stdout.write(
+            f'Всего {report["requests"]} запросов за {report["elapsed"]:.2f} с, '
+            f'{report["rps"]:.1f} запросов/с (время в мс)'
+        )
+
+    def print_comparison(self, baseline, report):
+        self.stdout.write(
+            f'Сравнение с базовой линией ({baseline.get("recipes")} рецептов, '
+            f'режим {baseline.get("mode")}):'
+        )
+        regressions = 0
+        for name, stats in sorted(report['endpoints'].items()):
+            before = baseline['endpoints'].get(name)
+            if before is None:
+                self.stdout.write(f'  {name}: нет в базовой линии')
+                continue
+            notes = []
+            for key in ('p50', 'p95'):
+                change = (stats[key] - before[key]) / before[key] if before[key] else 0
+                notes.append(f'{key} {before[key]:.2f} → {stats[key]:.2f} ({change:+.0%})')
+                if change > REGRESSION_THRESHOLD:
+                    regressions += 1
+            if stats['queries'] != before['queries']:
+                notes.append(f'SQL {before["queries"]} → {stats["queries"]}')
+                if (stats['queries'] or 0) > (before['queries'] or 0):
+                    regressions += 1
+            self.stdout.write(f'  {name}: ' + ', '.join(notes))
+        style = self.style.WARNING if regressions else self.style.SUCCESS
+        self.stdout.write(style(f'Ухудшений: {regressions}'))
@@ -0,0 +1,51 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+
+from recipes import autocomplete
+from recipes.models import Ingredient
+
+
+class Command(BaseCommand):
+    help = 'Замеряет задержку автодополнения ингредиентов на каждое нажатие клавиши'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--words', type=int, default=200)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        names = list(Ingredient.objects.values_list('name', flat=True))
+        if not names:
+            self.stdout.write(self.style.ERROR(
+                'Нет ингредиентов, сначала выполните load_ingredients.'
+            ))
+            return
+        random.seed(options['seed'])
+        words = random.sample(names, k=min(options['words'], len(names)))
+        keystrokes = [word[:i] for word in words for i in range(1, len(word) + 1)]
+
+        started = time.perf_counter()
+        autocomplete.invalidate_index()
+        autocomplete.get_index()
+        build_ms = (time.perf_counter() - started) * 1000
+        self.stdout.write(f'Построение индекса: {build_ms:.1f} мс ({len(names)} строк)')
+
+        limit = 50
+        self.report('in-memory', keystrokes, lambda q: autocomplete.get_index().search(q, limit))
+        self.report('database', keystrokes, lambda q: list(autocomplete.search_db(q, limit)))
+
+    def report(self, label, keystrokes, search):
+        timings = []
+        for query in keystrokes:
+            started = time.perf_counter()
+            search(query)
+            timings.append((time.perf_counter() - started) * 1_000_000)
+        timings.sort()
+        p95 = timings[int(len(timings) * 0.95) - 1]
+        self.stdout.write(
+            f'{label}: {len(timings)} нажатий, '
+            f'p50 {statistics.median(timings):.0f} мкс, p95 {p95:.0f} мкс, '
+            f'max {timings[-1]:.0f} мкс'
+        )
@@ -0,0 +1,219 @@
+import asyncio
+import json
+import statistics
+import time
+from collections import Counter
+from urllib.parse import quote, urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes import shortlinks
+from recipes.models import Ingredient, Recipe, Tag
+
+
+async def read_response(reader):
+    """Читает HTTP/1.1-ответ; возвращает статус и можно ли продолжать соединение."""
+    head = await reader.readuntil(b'\r\n\r\n')
+    lines = head.decode('latin-1').split('\r\n')
+    status = int(lines[0].split()[1])
+    headers = {}
+    for line in lines[1:]:
+        if ':' in line:
+            name, value = line.split(':', 1)
+            headers[name.strip().lower()] = value.strip()
+    if 'content-length' in headers:
+        await reader.readexactly(int(headers['content-length']))
+    elif headers.get('transfer-encoding') == 'chunked':
+        while True:
+            size = int((await reader.readline()).split(b';')[0], 16)
+            await reader.readexactly(size + 2)
+            if not size:
+                break
+    else:
+        await reader.read()
+        return status, False
+    return status, headers.get('connection', '').lower() != 'close'
+
+
+class Command(BaseCommand):
+    help = (
+        'Держит N одновременных соединений к запущенному серверу и замеряет '
+        'задержку и пропускную способность эндпоинтов чтения. Запустите его '
+        'против gunicorn foodgram.wsgi и gunicorn -c gunicorn_asgi.py '
+        'foodgram.asgi на одной базе и сравните результаты.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000')
+        parser.add_argument('--connections', type=int, default=500)
+        parser.add_argument('--duration', type=float, default=20.0)
+        parser.add_argument('--timeout', type=float, default=30.0)
+        parser.add_argument(
+            '--path', action='append', dest='paths',
+            help='Путь запроса, можно несколько; по умолчанию — список и '
+                 'карточка рецепта, ингредиенты, теги и короткая ссылка',
+        )
+        parser.add_argument(
+            '--slow-clients', type=int, default=0,
+            help='Сколько из соединений передают запрос медленно, по частям',
+        )
+        parser.add_argument(
+            '--slow-delay', type=float, default=0.5,
+            help='Пауза между частями запроса медленного клиента, секунды',
+        )
+        parser.add_argument('--token', help='Токен для заголовка Authorization')
+        parser.add_argument('--label', default='', help='Подпись прогона, например sync или asgi')
+        parser.add_argument('--save', help='Сохранить результаты в JSON')
+        parser.add_argument('--compare', help='Сравнить с сохранённым JSON')
+
+    def handle(self, *args, **options):
+        url = urlsplit(options['url'])
+        if url.scheme != 'http' or not url.hostname:
+            raise CommandError('Нужен адрес вида http://host:port')
+        paths = options['paths'] or self.default_paths()
+        report = asyncio.run(self.run(url.hostname, url.port or 80, paths, options))
+        report['label'] = options['label']
+        self.print_report(report)
+        if options['compare']:
+            with open(options['compare'], encoding='utf-8') as file:
+                self.print_comparison(json.load(file), report)
+        if options['save']:
+            with open(options['save'], 'w', encoding='utf-8') as file:
+                json.dump(report, file, ensure_ascii=False, indent=2)
+            self.stdout.write(f'Результаты сохранены в {options["save"]}')
+
+    def default_paths(self):
+        recipe_id = Recipe.objects.values_list('pk', flat=True).first()
+        if recipe_id is None:
+            raise CommandError('Нет рецептов, сначала выполните load_test_data.')
+        paths = [
+            '/api/recipes/',
+            f'/api/recipes/{recipe_id}/',
+            '/api/tags/',
+            f'/s/{shortlinks.encode(recipe_id)}/',
+        ]
+        ingredient = Ingredient.objects.order_by('id').first()
+        if ingredient is not None:
+            paths.append(f'/api/ingredients/?name={ingredient.name[:2]}')
+        if Tag.objects.exists():
+            paths.append(f'/api/recipes/?tags={Tag.objects.first().slug}')
+        return paths
+
+    async def run(self, host, port, paths, options):
+        deadline = time.monotonic() + options['duration']
+        samples = []
+        errors = Counter()
+        headers = f'Host: {host}\r\nAccept: application/json\r\n'
+        if options['token']:
+            headers += f'Authorization: Token {options["token"]}\r\n'
+        requests = [
+            (path, f'GET {quote(path, safe="/?=&")} HTTP/1.1\r\n{headers}\r\n'.encode())
+            for path in paths
+        ]
+
+        async def send(writer, request, slow):
+            if not slow:
+                writer.write(request)
+                return
+            # Медленный клиент: запрос приходит частями по 16 байт
+            for start in range(0, len(request), 16):
+                writer.write(request[start:start + 16])
+                await writer.drain()
+                await asyncio.sleep(options['slow_delay'])
+
+        async def connection(number, slow):
+            reader = writer = None
+            sent = number
+            while time.monotonic() < deadline:
+                path, request = requests[sent % len(requests)]
+                sent += 1
+                started = time.perf_counter()
+                try:
+                    if writer is None:
+                        reader, writer = await asyncio.wait_for(
+                            asyncio.open_connection(host, port), options['timeout']
+                        )
+                    await send(writer, request, slow)
+                    status, keep_alive = await asyncio.wait_for(
+                        read_response(reader), options['timeout']
+                    )
+                except (OSError, ValueError, asyncio.TimeoutError,
+                        asyncio.IncompleteReadError) as error:
+                    errors[type(error).__name__] += 1
+                    keep_alive = False
+                else:
+                    # Время включает ожидание соединения в очереди сервера
+                    samples.append((
+                        f'[slow] {path}' if slow else path, status,
+                        time.perf_counter() - started,
+                    ))
+                if not keep_alive and writer is not None:
+                    writer.close()
+                    reader = writer = None
+            if writer is not None:
+                writer.close()
+
+        started = time.perf_counter()
+        slow_clients = min(options['slow_clients'], options['connections'])
+        await asyncio.gather(*(
+            connection(number, slow=number < slow_clients)
+            for number in range(options['connections'])
+        ))
+        elapsed = time.perf_counter() - started
+        return self.summarize(samples, errors, elapsed, options)
+
+    def summarize(self, samples, errors, elapsed, options):
+        def latency(values):
+            values = sorted(value * 1000 for value in values)
+            if len(values) < 2:
+                return dict.fromkeys(('p50', 'p95', 'p99'), round(values[0], 3) if values else None)
+            quantiles = statistics.quantiles(values, n=100, method='inclusive')
+            return {f'p{q}': round(quantiles[q - 1], 3) for q in (50, 95, 99)}
+
+        by_path = {}
+        for path in dict.fromkeys(path for path, _, _ in samples):
+            durations = [duration for p, _, duration in samples if p == path]
+            by_path[path] = {'requests': len(durations), **latency(durations)}
+        # Итоговые цифры — по обычным клиентам; медленные видны в разбивке по путям
+        fast = [sample for sample in samples if not sample[0].startswith('[slow]')]
+        return {
+            'connections': options['connections'],
+            'slow_clients': options['slow_clients'],
+            'duration': round(elapsed, 3),
+            'requests': len(fast),
+            'rps': round(len(fast) / elapsed, 1),
+            **latency([duration for _, _, duration in fast]),
+            'statuses': dict(Counter(str(status) for _, status, _ in fast)),
+            'errors': dict(errors),
+            'paths': by_path,
+        }
+
+    def print_report(self, report):
+        label = f' [{report["label"]}]' if report['label'] else ''
+        self.stdout.write(
+            f'{report["connections"]} соединений{label}, из них медленных '
+            f'{report["slow_clients"]}: {report["requests"]} ответов '
+            f'за {report["duration"]:.1f} с, {report["rps"]:.1f} запросов/с'
+        )
+        self.stdout.write(
+            f'p50 {report["p50"]} мс, p95 {report["p95"]} мс, p99 {report["p99"]} мс; '
+            f'статусы {report["statuses"]}, ошибки {report["errors"] or "нет"}'
+        )
+        for path, stats in report['paths'].items():
+            self.stdout.write(
+                f'  {path:<48} {stats["requests"]:>7} '
+                f'p50 {stats["p50"]:>9} p95 {stats["p95"]:>9} p99 {stats["p99"]:>9}'
+            )
+
+    def print_comparison(self, baseline, report):
+        self.stdout.write(
+            f'Сравнение с {baseline.get("label") or "базовой линией"} '
+            f'({baseline["connections"]} соединений):'
+        )
+        for key in ('rps', 'p50', 'p95', 'p99'):
+            before, after = baseline[key], report[key]
+            if before and after is not None:
+                self.stdout.write(f'  {key}: {before} → {after} ({after / before:.2f}×)')
+        self.stdout.write(
+            f'  ошибки: {sum(baseline["errors"].values())} → {sum(report["errors"].values())}'
+        )
@@ -0,0 +1,51 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from recipes import search
+from recipes.models import Ingredient, Recipe
+
+DEFAULT_QUERIES = ['рецепт 1', 'описание', 'мука', 'сахар молоко', 'курица']
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает полнотекстовый поиск рецептов с ILIKE-сканированием. '
+        'Данные — load_test_data --recipes 1000000.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('queries', nargs='*', default=DEFAULT_QUERIES)
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--limit', type=int, default=10)
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            f'Рецептов: {Recipe.objects.count()}, '
+            f'ингредиентов: {Ingredient.objects.count()}'
+        )
+        for query in options['queries']:
+            for label, run in (
+                ('fts', lambda q: search.search(Recipe.objects.all(), q)),
+                ('ilike', self.ilike),
+            ):
+                timings = []
+                for _ in range(options['repeat']):
+                    started = time.perf_counter()
+                    found = list(run(query).values_list('id', flat=True)[:options['limit']])
+                    timings.append((time.perf_counter() - started) * 1000)
+                self.stdout.write(
+                    f'{query!r:>16} {label:>5}: median {statistics.median(timings):8.2f} мс, '
+                    f'найдено на странице {len(found)}'
+                )
+
+    def ilike(self, query):
+        condition = Q()
+        for word in search.WORD_RE.findall(query):
+            condition &= (
+                Q(name__icontains=word) | Q(text__icontains=word)
+                | Q(recipe_ingredients__ingredient__name__icontains=word)
+            )
+        return Recipe.objects.filter(condition).distinct()
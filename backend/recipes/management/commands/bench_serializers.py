@@ -0,0 +1,108 @@
+import statistics
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+from django.test import RequestFactory
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+
+from recipes import renderers
+from recipes.models import Recipe
+from recipes.renderers import FastJSONRenderer
+from recipes.serializers import RecipeRowSerializer, RecipeSerializer
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеряет стоимость сериализации одной карточки рецепта в большом '
+        'ответе: RecipeSerializer на моделях против RecipeRowSerializer на '
+        'строках .values(), и рендеринг JSON стандартным и orjson-рендерером.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=1000)
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument(
+            '--anonymous', action='store_true',
+            help='Без пользователя; по умолчанию — пользователь с самым '
+                 'большим избранным',
+        )
+
+    def handle(self, *args, **options):
+        count = options['count']
+        if not Recipe.objects.exists():
+            raise CommandError('Нет рецептов, сначала выполните load_test_data.')
+        factory = RequestFactory(HTTP_HOST=settings.ALLOWED_HOSTS[0])
+        request = Request(factory.get('/api/recipes/'))
+        request.user = AnonymousUser() if options['anonymous'] else (
+            User.objects.annotate(total=Count('favorites'))
+            .order_by('-total').first() or AnonymousUser()
+        )
+        context = {'request': request}
+
+        def load_models():
+            return list(Recipe.objects.with_related()[:count])
+
+        def load_rows():
+            serializer = RecipeRowSerializer(
+                list(Recipe.objects.values(*RecipeRowSerializer.values)[:count]),
+                many=True, context=context,
+            )
+            serializer.load()
+            return serializer
+
+        # Флаги пользователя загружаются один раз на запрос, вне замеров
+        RecipeSerializer(
+            Recipe.objects.with_related()[:1], many=True, context=context
+        ).data
+        results = {}
+        for label, load, serialize in (
+            ('RecipeSerializer', load_models,
+             lambda recipes: RecipeSerializer(recipes, many=True, context=context).data),
+            ('RecipeRowSerializer', load_rows, lambda serializer: serializer.data),
+        ):
+            timings = {'load': [], 'serialize': []}
+            for _ in range(options['repeat']):
+                started = time.perf_counter()
+                loaded = load()
+                timings['load'].append(time.perf_counter() - started)
+                # Строки сериализатора загружены заранее: замер без запросов
+                started = time.perf_counter()
+                data = serialize(loaded)
+                timings['serialize'].append(time.perf_counter() - started)
+            results[label] = data
+            self.report(label, len(data), timings)
+
+        for renderer in (JSONRenderer(), FastJSONRenderer()):
+            timings = {'render': []}
+            for _ in range(options['repeat']):
+                started = time.perf_counter()
+                renderer.render(results['RecipeRowSerializer'])
+                timings['render'].append(time.perf_counter() - started)
+            label = type(renderer).__name__
+            if isinstance(renderer, FastJSONRenderer) and renderers.orjson is None:
+                label += ' (orjson не установлен)'
+            self.report(label, len(results['RecipeRowSerializer']), timings)
+
+        identical = (
+            JSONRenderer().render(results['RecipeSerializer'])
+            == FastJSONRenderer().render(results['RecipeRowSerializer'])
+        )
+        style = self.style.SUCCESS if identical else self.style.ERROR
+        self.stdout.write(style(
+            'JSON совпадает побайтно' if identical else 'JSON различается'
+        ))
+
+    def report(self, label, items, timings):
+        # Медиана по повторам, в микросекундах на карточку
+        parts = [
+            f'{name} {statistics.median(values) * 1_000_000 / max(items, 1):.1f} мкс'
+            for name, values in timings.items()
+        ]
+        self.stdout.write(f'{label}: {items} карточек, ' + ', '.join(parts))
@@ -0,0 +1,83 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import F, Sum
+
+from recipes import shopping_list, units
+from recipes.models import Ingredient, Recipe, RecipeIngredient
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеряет сборку списка покупок для корзины из N случайных рецептов: '
+        'SQL-агрегацию по названию и единице против суммирования с учётом '
+        'единиц и рендеринг txt.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, default=500)
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        recipe_ids = list(Recipe.objects.values_list('pk', flat=True))
+        if not recipe_ids:
+            raise CommandError('Нет рецептов, сначала выполните load_test_data.')
+        random.seed(options['seed'])
+        cart = random.sample(recipe_ids, k=min(options['recipes'], len(recipe_ids)))
+
+        # Строки корзины — то, что суммируется при промахе кеша
+        rows = list(RecipeIngredient.objects.filter(
+            recipe_id__in=cart
+        ).values_list('ingredient_id', 'amount'))
+        ids = [pk for pk, _ in rows]
+        amounts = [amount for _, amount in rows]
+        ingredients = {
+            pk: (name, unit) for pk, name, unit in Ingredient.objects.filter(
+                pk__in=set(ids)
+            ).values_list('pk', 'name', 'measurement_unit')
+        }
+        # Суммы по ингредиентам — то, что лежит в кеше shopping_list
+        totals = {}
+        for pk, amount in rows:
+            totals[pk] = totals.get(pk, 0) + amount
+        self.stdout.write(
+            f'Корзина: {len(cart)} рецептов, {len(rows)} строк, '
+            f'{len(ingredients)} ингредиентов'
+        )
+
+        sql_rows = self.measure('SQL GROUP BY название, единица', options, lambda: list(
+            RecipeIngredient.objects.filter(recipe_id__in=cart).values(
+                name=F('ingredient__name'),
+                measurement_unit=F('ingredient__measurement_unit'),
+            ).annotate(amount=Sum('amount'))
+        ))
+        self.measure(
+            'units.aggregate, строки корзины', options,
+            lambda: units.aggregate(ingredients, ids, amounts),
+        )
+        result = self.measure(
+            'units.aggregate, суммы из кеша', options,
+            lambda: units.aggregate(ingredients, list(totals), list(totals.values())),
+        )
+        self.measure('render_txt', options, lambda: ''.join(
+            shopping_list.render_txt(result)
+        ))
+        self.stdout.write(
+            f'Строк в списке: {len(sql_rows)} без учёта единиц, '
+            f'{len(result)} с учётом'
+        )
+
+    def measure(self, label, options, function):
+        timings = []
+        for _ in range(options['repeat']):
+            started = time.perf_counter()
+            result = function()
+            timings.append((time.perf_counter() - started) * 1000)
+        self.stdout.write(
+            f'{label}: p50 {statistics.median(timings):.2f} мс, '
+            f'min {min(timings):.2f} мс'
+        )
+        return result
@@ -1,31 +1,149 @@
 import csv
-from django.core.management.base import BaseCommand
-from recipes.models import Ingredient
-from django.conf import settings
+import io
+import json
 import os
+import time
+from itertools import islice
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from recipes.autocomplete import invalidate_index
+from recipes.caching import bump_version
+from recipes.models import Ingredient
+
+DEFAULT_PATH = os.path.join(settings.BASE_DIR, '..', 'data', 'ingredients.csv')
+
+
+def read_csv(file):
+    for row in csv.reader(file):
+        if len(row) != 2:
+            continue
+        name, measurement_unit = row
+        if name == 'name' and measurement_unit == 'measurement_unit':
+            continue  # пропускаем заголовок
+        yield name, measurement_unit
+
+
+def read_json(file, chunk_size=64 * 1024):
+    # Элементы массива разбираются по мере чтения, без загрузки всего файла
+    decoder = json.JSONDecoder()
+    buffer = ''
+    started = False
+    while True:
+        chunk = file.read(chunk_size)
+        buffer += chunk
+        while True:
+            buffer = buffer.lstrip()
+            if not started:
+                if not buffer:
+                    break
+                if buffer[0] != '[':
+                    raise CommandError('JSON должен содержать массив объектов.')
+                buffer = buffer[1:]
+                started = True
+                continue
+            if buffer[:1] in (',', ']'):
+                buffer = buffer[1:]
+                continue
+            try:
+                item, end = decoder.raw_decode(buffer)
+            except json.JSONDecodeError:
+                break
+            buffer = buffer[end:]
+            yield item['name'], item['measurement_unit']
+        if not chunk:
+            return
+
+
+READERS = {'.csv': read_csv, '.json': read_json}
+
+
+def unique_rows(rows):
+    seen = set()
+    for name, measurement_unit in rows:
+        key = (name.strip(), measurement_unit.strip())
+        if not all(key) or key in seen:
+            continue
+        seen.add(key)
+        yield key
+
+
+def batches(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
 
 class Command(BaseCommand):
-    help = 'Загружает ингредиенты из data/ingredients.csv'
+    help = 'Загружает ингредиенты из CSV или JSON (по умолчанию data/ingredients.csv)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default=DEFAULT_PATH)
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--copy', action='store_true',
+            help='Использовать COPY (только PostgreSQL)'
+        )
 
     def handle(self, *args, **options):
-        # Путь к data/ingredients.csv на уровень выше backend
-        file_path = os.path.abspath(os.path.join(settings.BASE_DIR, '..', 'data', 'ingredients.csv'))
+        file_path = os.path.abspath(options['path'])
         if not os.path.exists(file_path):
             self.stdout.write(self.style.ERROR(f'Файл {file_path} не найден.'))
             return
-        with open(file_path, encoding='utf-8') as csvfile:
-            reader = csv.reader(csvfile)
-            count = 0
-            for row in reader:
-                if len(row) != 2:
-                    continue
-                name, measurement_unit = row
-                if name == 'name' and measurement_unit == 'measurement_unit':
-                    continue  # пропускаем заголовок
-                obj, created = Ingredient.objects.get_or_create(
-                    name=name.strip(),
-                    measurement_unit=measurement_unit.strip()
-                )
-                if created:
-                    count += 1
-            self.stdout.write(self.style.SUCCESS(f'Загружено {count} ингредиентов.')) 
\ No newline at end of file
+        reader = READERS.get(os.path.splitext(file_path)[1].lower())
+        if reader is None:
+            raise CommandError('Поддерживаются только файлы .csv и .json.')
+        if options['copy'] and connection.vendor != 'postgresql':
+            raise CommandError('--copy доступен только для PostgreSQL.')
+        save_batch = self.copy_batch if options['copy'] else self.insert_batch
+
+        started = time.perf_counter()
+        before = Ingredient.objects.count()
+        processed = 0
+        with open(file_path, encoding='utf-8') as file, transaction.atomic():
+            for batch in batches(unique_rows(reader(file)), options['batch_size']):
+                save_batch(batch)
+                processed += len(batch)
+        count = Ingredient.objects.count() - before
+        elapsed = time.perf_counter() - started
+        invalidate_index()
+        bump_version('ingredients')
+        self.stdout.write(self.style.SUCCESS(
+            f'Загружено {count} ингредиентов '
+            f'({processed} строк за {elapsed:.2f} с, '
+            f'{processed / elapsed if elapsed else processed:.0f} строк/с).'
+        ))
+
+    def insert_batch(self, batch):
+        Ingredient.objects.bulk_create(
+            [
+                Ingredient(name=name, measurement_unit=measurement_unit)
+                for name, measurement_unit in batch
+            ],
+            ignore_conflicts=True,
+        )
+
+    def copy_batch(self, batch):
+        table = Ingredient._meta.db_table
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(batch)
+        buffer.seek(0)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'CREATE TEMP TABLE IF NOT EXISTS ingredient_import '
+                '(name varchar(200), measurement_unit varchar(50)) '
+                'ON COMMIT DROP'
+            )
+            cursor.cursor.copy_expert(
+                'COPY ingredient_import (name, measurement_unit) '
+                'FROM STDIN WITH (FORMAT csv)',
+                buffer,
+            )
+            cursor.execute(
+                f'INSERT INTO {table} (name, measurement_unit) '
+                'SELECT name, measurement_unit FROM ingredient_import '
+                'ON CONFLICT DO NOTHING'
+            )
+            cursor.execute('TRUNCATE ingredient_import')
@@ -1,15 +1,73 @@
 from django.core.management.base import BaseCommand
 from django.contrib.auth import get_user_model
-from recipes.models import Tag, Recipe, Ingredient, RecipeIngredient
+from django.contrib.auth.hashers import make_password
+from django.core.files.storage import default_storage
+from django.db import transaction
+from recipes import search
+from recipes.models import (
+    Tag, Recipe, Ingredient, RecipeIngredient, Favorite, ShoppingCart,
+    Subscription
+)
 from django.core.files.base import ContentFile
+from itertools import islice
 import random
+import time
 
 User = get_user_model()
 
+PLACEHOLDER_GIF = b'\x47\x49\x46\x38\x39\x61\x01\x00\x01\x00\x80\x00\x00\x00\x00\x00\xFF\xFF\xFF\x21\xF9\x04\x01\x00\x00\x00\x00\x2C\x00\x00\x00\x00\x01\x00\x01\x00\x00\x02\x02\x4C\x01\x00\x3B'
+PLACEHOLDER_PATH = 'recipes/images/placeholder.gif'
+
+TAG_DATA = [
+    {'name': 'Завтрак', 'color': '#E26C2D', 'slug': 'breakfast'},
+    {'name': 'Обед', 'color': '#49B64E', 'slug': 'lunch'},
+    {'name': 'Ужин', 'color': '#8775D2', 'slug': 'dinner'},
+]
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def unique_pairs(rng, left, right, count, distinct=False):
+    """count различных пар (left, right) — выборка без повторений.
+
+    С distinct=True пары из одинаковых id (подписка на себя) исключены.
+    """
+    width = len(right) - 1 if distinct else len(right)
+    for index in rng.sample(range(len(left) * width), min(count, len(left) * width)):
+        row, column = divmod(index, width)
+        if distinct and column >= row:
+            column += 1
+        yield left[row], right[column]
+
+
 class Command(BaseCommand):
-    help = 'Создаёт тестовых пользователей, теги и рецепты.'
+    help = (
+        'Создаёт тестовых пользователей, теги и рецепты. С параметрами '
+        '--users/--recipes/... генерирует детерминированный набор данных '
+        'для нагрузочного тестирования.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=0)
+        parser.add_argument('--recipes', type=int, default=0)
+        parser.add_argument('--favorites', type=int, default=0)
+        parser.add_argument('--carts', type=int, default=0)
+        parser.add_argument('--subscriptions', type=int, default=0)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--batch-size', type=int, default=5000)
 
     def handle(self, *args, **options):
+        scale_options = ('users', 'recipes', 'favorites', 'carts', 'subscriptions')
+        if any(options[name] for name in scale_options):
+            self.generate(**options)
+        else:
+            self.create_demo()
+
+    def create_demo(self):
         # Создание пользователей
         users = []
         for i in range(1, 4):
@@ -24,15 +82,7 @@ class Command(BaseCommand):
         self.stdout.write(self.style.SUCCESS('Созданы тестовые пользователи.'))
 
         # Создание тегов
-        tag_data = [
-            {'name': 'Завтрак', 'color': '#E26C2D', 'slug': 'breakfast'},
-            {'name': 'Обед', 'color': '#49B64E', 'slug': 'lunch'},
-            {'name': 'Ужин', 'color': '#8775D2', 'slug': 'dinner'},
-        ]
-        tags = []
-        for data in tag_data:
-            tag, _ = Tag.objects.get_or_create(**data)
-            tags.append(tag)
+        tags = self.create_tags()
         self.stdout.write(self.style.SUCCESS('Созданы теги.'))
 
         # Получаем ингредиенты
@@ -47,7 +97,7 @@ class Command(BaseCommand):
                 cooking_time=random.randint(10, 60),
             )
             # Добавляем картинку-заглушку
-            recipe.image.save(f'test{i}.jpg', ContentFile(b'\x47\x49\x46\x38\x39\x61\x01\x00\x01\x00\x80\x00\x00\x00\x00\x00\xFF\xFF\xFF\x21\xF9\x04\x01\x00\x00\x00\x00\x2C\x00\x00\x00\x00\x01\x00\x01\x00\x00\x02\x02\x4C\x01\x00\x3B'))
+            recipe.image.save(f'test{i}.jpg', ContentFile(PLACEHOLDER_GIF))
             recipe.tags.set(tags[:random.randint(1, 3)])
             # Добавляем ингредиенты
             for ing in random.sample(ingredients, k=3):
@@ -56,4 +106,113 @@ class Command(BaseCommand):
                     ingredient=ing,
                     amount=random.randint(1, 5)
                 )
-        self.stdout.write(self.style.SUCCESS('Созданы тестовые рецепты.')) 
\ No newline at end of file
+        self.stdout.write(self.style.SUCCESS('Созданы тестовые рецепты.'))
+
+    def create_tags(self):
+        return [Tag.objects.get_or_create(**data)[0] for data in TAG_DATA]
+
+    @transaction.atomic
+    def generate(self, users, recipes, favorites, carts, subscriptions,
+                 seed, batch_size, **options):
+        rng = random.Random(seed)
+        self.batch_size = batch_size
+        started = time.perf_counter()
+
+        # Порядок id задан явно, иначе --seed не воспроизводим на Postgres
+        user_ids = self.generate_users(users)
+        if not user_ids:
+            user_ids = list(User.objects.order_by('id').values_list('id', flat=True))
+        recipe_ids = self.generate_recipes(rng, recipes, user_ids)
+        if not recipe_ids:
+            recipe_ids = list(Recipe.objects.order_by('id').values_list('id', flat=True))
+
+        for model, count in ((Favorite, favorites), (ShoppingCart, carts)):
+            if count and user_ids and recipe_ids:
+                self.bulk_insert(model, (
+                    model(user_id=user_id, recipe_id=recipe_id)
+                    for user_id, recipe_id in unique_pairs(
+                        rng, user_ids, recipe_ids, count
+                    )
+                ))
+        # bulk_create не отправляет сигналы, счётчики и поисковый индекс
+        # пересчитываются разом
+        Recipe.objects.recount_counters()
+        if recipes:
+            search.rebuild()
+        if subscriptions and len(user_ids) > 1:
+            self.bulk_insert(Subscription, (
+                Subscription(user_id=user_id, author_id=author_id)
+                for user_id, author_id in unique_pairs(
+                    rng, user_ids, user_ids, subscriptions, distinct=True
+                )
+            ))
+        self.stdout.write(self.style.SUCCESS(
+            f'Данные сгенерированы за {time.perf_counter() - started:.1f} с.'
+        ))
+
+    def generate_users(self, count):
+        if not count:
+            return []
+        # Хеширование пароля дорогое, поэтому хеш вычисляется один раз
+        password = make_password('testpass123')
+        self.bulk_insert(User, (
+            User(
+                username=f'perf_user{i}',
+                email=f'perf_user{i}@test.com',
+                password=password
+            ) for i in range(count)
+        ))
+        return list(
+            User.objects.filter(username__startswith='perf_user')
+            .order_by('id').values_list('id', flat=True)
+        )
+
+    def generate_recipes(self, rng, count, user_ids):
+        if not count or not user_ids:
+            return []
+        tag_ids = [tag.id for tag in self.create_tags()]
+        ingredient_ids = list(Ingredient.objects.values_list('id', flat=True))
+        if not default_storage.exists(PLACEHOLDER_PATH):
+            default_storage.save(PLACEHOLDER_PATH, ContentFile(PLACEHOLDER_GIF))
+
+        recipe_ids = []
+        for number, batch in enumerate(chunked(range(count), self.batch_size)):
+            created = Recipe.objects.bulk_create([
+                Recipe(
+                    author_id=rng.choice(user_ids),
+                    name=f'Рецепт {i}',
+                    text=f'Описание рецепта {i}',
+                    cooking_time=rng.randint(5, 180),
+                    image=PLACEHOLDER_PATH,
+                ) for i in batch
+            ])
+            ids = [recipe.id for recipe in created]
+            Recipe.tags.through.objects.bulk_create([
+                Recipe.tags.through(recipe_id=recipe_id, tag_id=tag_id)
+                for recipe_id in ids
+                for tag_id in rng.sample(tag_ids, rng.randint(1, len(tag_ids)))
+            ])
+            if ingredient_ids:
+                RecipeIngredient.objects.bulk_create([
+                    RecipeIngredient(
+                        recipe_id=recipe_id,
+                        ingredient_id=ingredient_id,
+                        amount=rng.randint(1, 500)
+                    )
+                    for recipe_id in ids
+                    for ingredient_id in rng.sample(
+                        ingredient_ids, min(rng.randint(3, 10), len(ingredient_ids))
+                    )
+                ])
+            recipe_ids.extend(ids)
+            self.stdout.write(f'{Recipe._meta.verbose_name_plural}: {len(recipe_ids)}')
+        return recipe_ids
+
+    def bulk_insert(self, model, objects):
+        # ignore_conflicts пропускает строки, уже лежащие в базе от прошлых
+        # запусков, поэтому в отчёте — реально добавленные
+        before = model.objects.count()
+        for batch in chunked(objects, self.batch_size):
+            model.objects.bulk_create(batch, ignore_conflicts=True)
+        total = model.objects.count() - before
+        self.stdout.write(f'{model._meta.verbose_name_plural}: {total}')
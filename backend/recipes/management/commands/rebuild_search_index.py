@@ -0,0 +1,21 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from recipes import search
+
+
+class Command(BaseCommand):
+    help = 'Полностью перестраивает полнотекстовый индекс рецептов'
+
+    def handle(self, *args, **options):
+        if not search.is_supported():
+            self.stdout.write(self.style.WARNING(
+                'Для этой СУБД поисковый индекс не используется.'
+            ))
+            return
+        started = time.perf_counter()
+        search.rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f'Индекс перестроен за {time.perf_counter() - started:.2f} с.'
+        ))
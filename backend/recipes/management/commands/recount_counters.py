@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает счётчики избранного и списков покупок у рецептов'
+
+    def handle(self, *args, **options):
+        fixed = Recipe.objects.recount_counters()
+        self.stdout.write(self.style.SUCCESS(f'Исправлено рецептов: {fixed}.'))
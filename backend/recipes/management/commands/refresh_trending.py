@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from recipes import trending
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает рейтинг популярных рецептов. Без --full добавляет '
+        'только новые события; запускается периодически (cron).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full', action='store_true',
+            help='Полный пересчёт (учитывает удаления из избранного и корзины)'
+        )
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        refresh = trending.rebuild if options['full'] else trending.refresh
+        count = refresh(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Обновлено рецептов: {count} за {time.perf_counter() - started:.2f} с.'
+        ))
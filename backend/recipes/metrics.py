@@ -0,0 +1,137 @@
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from rest_framework import serializers
+
+# Границы гистограммы времени ответа, секунды
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+current = ContextVar('request_metrics', default=None)
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.timings = defaultdict(float)
+
+    def record_query(self, duration):
+        self.queries += 1
+        self.db_time += duration
+
+
+def record_query(execute, sql, params, many, context):
+    """Обёртка выполнения SQL, учитывающая запрос в метриках текущего запроса.
+
+    Ставится на каждое соединение (signals.install_query_metrics), а не на
+    время запроса: соединения привязаны к потоку, и под ASGI запросы async ORM
+    выполняются в другом потоке, куда ContextVar копируется вместе с контекстом.
+    """
+    metrics = current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.record_query(time.perf_counter() - started)
+
+
+@contextmanager
+def timed(name):
+    """Добавляет длительность блока к метрике ``name`` текущего запроса."""
+    metrics = current.get()
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        if metrics is not None:
+            metrics.timings[name] += time.perf_counter() - started
+
+
+class TimedSerializerMixin:
+    """Учитывает время сериализации ответа в метрике ``serialize``.
+
+    Замеряется только сериализатор верхнего уровня, вложенные входят в него.
+    """
+
+    def to_representation(self, instance):
+        if self.parent is not None:
+            return super().to_representation(instance)
+        with timed('serialize'):
+            return super().to_representation(instance)
+
+
+class TimedListSerializer(TimedSerializerMixin, serializers.ListSerializer):
+    pass
+
+
+class Registry:
+    """Агрегаты по view в пределах процесса в формате Prometheus."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.views = {}
+
+    def observe(self, view, method, status, metrics, duration, size):
+        key = (view, method, str(status))
+        with self.lock:
+            stats = self.views.get(key)
+            if stats is None:
+                stats = self.views[key] = {
+                    'count': 0, 'duration': 0.0, 'queries': 0,
+                    'db_time': 0.0, 'serialize': 0.0, 'bytes': 0,
+                    'buckets': [0] * len(DURATION_BUCKETS),
+                }
+            stats['count'] += 1
+            stats['duration'] += duration
+            stats['queries'] += metrics.queries
+            stats['db_time'] += metrics.db_time
+            stats['serialize'] += metrics.timings.get('serialize', 0.0)
+            stats['bytes'] += size
+            for index, bound in enumerate(DURATION_BUCKETS):
+                if duration <= bound:
+                    stats['buckets'][index] += 1
+
+    def render(self, extra=()):
+        with self.lock:
+            views = {key: dict(value, buckets=list(value['buckets']))
+                     for key, value in self.views.items()}
+        lines = []
+        counters = (
+            ('requests_total', 'count', 'counter', 'Число запросов'),
+            ('request_db_queries_total', 'queries', 'counter', 'Число SQL-запросов'),
+            ('request_db_seconds_total', 'db_time', 'counter', 'Время в БД'),
+            ('request_serialize_seconds_total', 'serialize', 'counter', 'Время сериализации'),
+            ('response_bytes_total', 'bytes', 'counter', 'Размер ответов'),
+        )
+        for name, field, kind, help_text in counters:
+            lines.append(f'# HELP foodgram_{name} {help_text}')
+            lines.append(f'# TYPE foodgram_{name} {kind}')
+            for (view, method, status), stats in sorted(views.items()):
+                labels = f'view="{view}",method="{method}",status="{status}"'
+                lines.append(f'foodgram_{name}{{{labels}}} {stats[field]}')
+        lines.append('# HELP foodgram_request_duration_seconds Время ответа')
+        lines.append('# TYPE foodgram_request_duration_seconds histogram')
+        for (view, method, status), stats in sorted(views.items()):
+            labels = f'view="{view}",method="{method}",status="{status}"'
+            for bound, value in zip(DURATION_BUCKETS, stats['buckets']):
+                lines.append(
+                    f'foodgram_request_duration_seconds_bucket{{{labels},le="{bound}"}} {value}'
+                )
+            lines.append(
+                f'foodgram_request_duration_seconds_bucket{{{labels},le="+Inf"}} {stats["count"]}'
+            )
+            lines.append(f'foodgram_request_duration_seconds_sum{{{labels}}} {stats["duration"]}')
+            lines.append(f'foodgram_request_duration_seconds_count{{{labels}}} {stats["count"]}')
+        for name, kind, value in extra:
+            lines.append(f'# TYPE foodgram_{name} {kind}')
+            lines.append(f'foodgram_{name} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
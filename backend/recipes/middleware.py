@@ -0,0 +1,100 @@
+import logging
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+from .metrics import RequestMetrics, current, registry
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+class PerformanceMiddleware:
+    """Замеряет время ответа, SQL-запросы и сериализацию каждого запроса.
+
+    Результаты уходят в /api/metrics/ и, при SERVER_TIMING_ENABLED (по
+    умолчанию равна DEBUG), в заголовок Server-Timing. View может
+    объявить ``query_budget`` — число или словарь {action: число}; при
+    превышении пишется предупреждение, а с QUERY_BUDGET_STRICT = True
+    выбрасывается QueryBudgetExceeded (используется в тестах).
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        # Под ASGI цепочка middleware остаётся асинхронной, иначе каждая
+        # async-view выполнялась бы через поток
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        metrics = RequestMetrics()
+        token = current.set(metrics)
+        request._query_budget = None
+        try:
+            response = self.get_response(request)
+        finally:
+            current.reset(token)
+        return self.finish(request, response, metrics)
+
+    async def __acall__(self, request):
+        metrics = RequestMetrics()
+        token = current.set(metrics)
+        request._query_budget = None
+        try:
+            response = await self.get_response(request)
+        finally:
+            current.reset(token)
+        return self.finish(request, response, metrics)
+
+    def finish(self, request, response, metrics):
+        duration = time.perf_counter() - metrics.started
+        size = 0 if response.streaming else len(response.content)
+        view = getattr(request.resolver_match, 'view_name', None) or 'unmatched'
+        registry.observe(view, request.method, response.status_code,
+                         metrics, duration, size)
+        if getattr(settings, 'SERVER_TIMING_ENABLED', settings.DEBUG):
+            response['Server-Timing'] = self.server_timing(metrics, duration)
+        self.check_budget(request, view, metrics)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        budget = getattr(getattr(view_func, 'cls', view_func), 'query_budget', None)
+        if isinstance(budget, dict):
+            action = getattr(view_func, 'actions', {}).get(request.method.lower())
+            budget = budget.get(action)
+        request._query_budget = budget
+
+    @staticmethod
+    def server_timing(metrics, duration):
+        parts = [f'db;dur={metrics.db_time * 1000:.2f};desc="{metrics.queries} queries"']
+        parts.extend(
+            f'{name};dur={value * 1000:.2f}'
+            for name, value in metrics.timings.items()
+        )
+        parts.append(f'total;dur={duration * 1000:.2f}')
+        return ', '.join(parts)
+
+    @staticmethod
+    def check_budget(request, view, metrics):
+        budget = request._query_budget
+        if budget is None or metrics.queries <= budget:
+            return
+        message = (
+            f'{view} {request.method}: {metrics.queries} SQL-запросов '
+            f'при бюджете {budget}'
+        )
+        if getattr(settings, 'QUERY_BUDGET_STRICT', False):
+            raise QueryBudgetExceeded(message)
+        logger.warning(message, extra={
+            'event': 'query_budget_exceeded', 'view': view,
+            'queries': metrics.queries, 'budget': budget,
+        })
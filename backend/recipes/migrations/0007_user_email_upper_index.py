@@ -0,0 +1,33 @@
+from django.conf import settings
+from django.db import migrations
+
+# Вход ищет пользователя по email__iexact, что на Postgres превращается
+# в UPPER(email) = UPPER(%s); индекс нужен только там
+CREATE_SQL = [
+    'CREATE INDEX IF NOT EXISTS auth_user_email_upper_idx '
+    'ON auth_user (UPPER(email))',
+]
+DROP_SQL = [
+    'DROP INDEX IF EXISTS auth_user_email_upper_idx',
+]
+
+
+def run(statements):
+    def apply(apps, schema_editor):
+        if schema_editor.connection.vendor != 'postgresql':
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+    return apply
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0006_recipe_counters'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(run(CREATE_SQL), run(DROP_SQL)),
+    ]
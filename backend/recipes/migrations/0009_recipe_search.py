@@ -0,0 +1,81 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+# Поисковый индекс зависит от СУБД: tsvector с GIN-индексом на Postgres и
+# виртуальная таблица FTS5 на SQLite. Обновляется сигналами (recipes.signals).
+CREATE_SQL = {
+    'postgresql': [
+        'ALTER TABLE recipes_recipe ADD COLUMN IF NOT EXISTS search_vector tsvector',
+        'CREATE INDEX IF NOT EXISTS recipes_recipe_search_idx '
+        'ON recipes_recipe USING gin (search_vector)',
+    ],
+    'sqlite': [
+        'CREATE VIRTUAL TABLE IF NOT EXISTS recipes_recipe_fts '
+        "USING fts5(name, text, ingredients, tokenize='unicode61 remove_diacritics 2')",
+    ],
+}
+DROP_SQL = {
+    'postgresql': [
+        'DROP INDEX IF EXISTS recipes_recipe_search_idx',
+        'ALTER TABLE recipes_recipe DROP COLUMN IF EXISTS search_vector',
+    ],
+    'sqlite': [
+        'DROP TABLE IF EXISTS recipes_recipe_fts',
+    ],
+}
+
+# Первичное заполнение индекса. Копия запросов recipes.search на момент
+# миграции: код приложения может измениться, а миграция — нет
+INGREDIENT_NAMES_SQL = (
+    "COALESCE((SELECT {aggregate}(i.name, ' ') "
+    'FROM recipes_recipeingredient ri '
+    'JOIN recipes_ingredient i ON i.id = ri.ingredient_id '
+    "WHERE ri.recipe_id = r.id), '')"
+)
+FILL_SQL = {
+    'postgresql': [
+        'UPDATE recipes_recipe r SET search_vector = '
+        "setweight(to_tsvector('russian', r.name), 'A') || "
+        "setweight(to_tsvector('russian', "
+        f"{INGREDIENT_NAMES_SQL.format(aggregate='string_agg')}), 'B') || "
+        "setweight(to_tsvector('russian', r.text), 'C')",
+    ],
+    'sqlite': [
+        'INSERT INTO recipes_recipe_fts (rowid, name, text, ingredients) '
+        'SELECT r.id, r.name, r.text, '
+        f"{INGREDIENT_NAMES_SQL.format(aggregate='group_concat')} "
+        'FROM recipes_recipe r',
+    ],
+}
+
+
+def create(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    for statement in CREATE_SQL.get(vendor, []) + FILL_SQL.get(vendor, []):
+        schema_editor.execute(statement)
+
+
+def drop(apps, schema_editor):
+    for statement in DROP_SQL.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0008_trending'),
+    ]
+
+    operations = [
+        migrations.RunPython(create, drop),
+        migrations.CreateModel(
+            name='RecipeSearchEntry',
+            fields=[
+                ('recipe', models.OneToOneField(db_column='rowid', on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='search_entry', serialize=False, to='recipes.recipe')),
+            ],
+            options={
+                'db_table': 'recipes_recipe_fts',
+                'managed': False,
+            },
+        ),
+    ]
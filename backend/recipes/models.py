@@ -1,5 +1,8 @@
 from django.contrib.auth import get_user_model
 from django.db import models
+from django.utils import timezone
+from django.db.models import Count, F, OuterRef, Prefetch, Q, Subquery
+from django.db.models.functions import Coalesce
 
 User = get_user_model()
 
@@ -28,6 +31,40 @@ class Tag(models.Model):
     def __str__(self):
         return self.name
 
+class RecipeQuerySet(models.QuerySet):
+    def with_related(self):
+        # Автор, теги и ингредиенты страницы загружаются фиксированным
+        # числом запросов независимо от её размера. Порядок задан явно:
+        # RecipeRowSerializer выводит их в том же порядке
+        return self.select_related('author').prefetch_related(
+            Prefetch('tags', queryset=Tag.objects.order_by('pk')),
+            Prefetch(
+                'recipe_ingredients',
+                queryset=RecipeIngredient.objects.select_related(
+                    'ingredient'
+                ).order_by('pk'),
+            ),
+        )
+
+    def recount_counters(self):
+        # Пересчитывает денормализованные счётчики только там, где они
+        # разошлись с реальным числом строк; возвращает число исправленных
+        def count(model):
+            return Coalesce(Subquery(
+                model.objects.filter(recipe=OuterRef('pk'))
+                .values('recipe').annotate(total=Count('pk')).values('total')
+            ), 0)
+        return self.annotate(
+            actual_favorites=count(Favorite),
+            actual_shopping_carts=count(ShoppingCart),
+        ).filter(
+            ~Q(favorites_count=F('actual_favorites'))
+            | ~Q(shopping_cart_count=F('actual_shopping_carts'))
+        ).update(
+            favorites_count=count(Favorite),
+            shopping_cart_count=count(ShoppingCart),
+        )
+
 class Recipe(models.Model):
     author = models.ForeignKey(User, on_delete=models.CASCADE, related_name='recipes', verbose_name='Автор')
     name = models.CharField(max_length=200, verbose_name='Название')
@@ -42,11 +79,19 @@ class Recipe(models.Model):
     tags = models.ManyToManyField(Tag, related_name='recipes', verbose_name='Теги')
     cooking_time = models.PositiveIntegerField(verbose_name='Время приготовления (мин)')
     pub_date = models.DateTimeField(auto_now_add=True, verbose_name='Дата публикации')
+    favorites_count = models.PositiveIntegerField(default=0, editable=False, verbose_name='В избранном')
+    shopping_cart_count = models.PositiveIntegerField(default=0, editable=False, verbose_name='В списках покупок')
+
+    objects = RecipeQuerySet.as_manager()
 
     class Meta:
-        ordering = ['-pub_date']
+        ordering = ['-pub_date', '-id']
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
+        indexes = [
+            models.Index(fields=['-pub_date', '-id'], name='recipe_pub_date_id_idx'),
+            models.Index(fields=['author', '-pub_date', '-id'], name='recipe_author_pub_date_idx'),
+        ]
 
     def __str__(self):
         return self.name
@@ -67,6 +112,7 @@ class RecipeIngredient(models.Model):
 class Favorite(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='favorites')
     recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE, related_name='favorited_by')
+    created = models.DateTimeField(default=timezone.now, db_index=True, verbose_name='Добавлено')
 
     class Meta:
         verbose_name = 'Избранное'
@@ -79,6 +125,7 @@ class Favorite(models.Model):
 class ShoppingCart(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='shopping_cart')
     recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE, related_name='in_shopping_carts')
+    created = models.DateTimeField(default=timezone.now, db_index=True, verbose_name='Добавлено')
 
     class Meta:
         verbose_name = 'Список покупок'
@@ -88,6 +135,41 @@ class ShoppingCart(models.Model):
     def __str__(self):
         return f'{self.user} — {self.recipe} (в списке покупок)'
 
+class RecipePopularity(models.Model):
+    # Предрасчитанный рейтинг для /api/recipes/trending/; заполняется
+    # командой refresh_trending
+    recipe = models.OneToOneField(
+        Recipe,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='popularity',
+        verbose_name='Рецепт'
+    )
+    score = models.FloatField(default=0, db_index=True, verbose_name='Рейтинг')
+    refreshed_at = models.DateTimeField(default=timezone.now, verbose_name='Пересчитан')
+
+    class Meta:
+        verbose_name = 'Популярность рецепта'
+        verbose_name_plural = 'Популярность рецептов'
+
+    def __str__(self):
+        return f'{self.recipe_id}: {self.score:.3f}'
+
+class RecipeSearchEntry(models.Model):
+    # Строка полнотекстового индекса SQLite (FTS5, миграция 0009): модель
+    # нужна только для JOIN в recipes.search, таблицу ведёт сам search
+    recipe = models.OneToOneField(
+        Recipe,
+        on_delete=models.DO_NOTHING,
+        primary_key=True,
+        db_column='rowid',
+        related_name='search_entry',
+    )
+
+    class Meta:
+        managed = False
+        db_table = 'recipes_recipe_fts'
+
 class Subscription(models.Model):
     user = models.ForeignKey(
         User,
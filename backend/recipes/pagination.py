@@ -0,0 +1,76 @@
+from django.core.paginator import InvalidPage
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+
+
+class PageLimitPagination(PageNumberPagination):
+    page_size = 6
+    page_size_query_param = 'limit'
+    max_page_size = 100
+
+    def paginate_queryset(self, queryset, request, view=None):
+        page = self.get_page(queryset, request)
+        return None if page is None else list(page)
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        # Для async-view (recipes.async_views): COUNT и строки страницы
+        # читаются async ORM, остальное — общий get_page
+        page = self.get_page(queryset, request, count=await queryset.acount())
+        if page is None:
+            return None
+        page.object_list = [item async for item in page.object_list]
+        return page.object_list
+
+    def get_page(self, queryset, request, count=None):
+        # PageNumberPagination.paginate_queryset без чтения страницы
+        self.request = request
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+        paginator = self.django_paginator_class(queryset, page_size)
+        if count is not None:
+            paginator.count = count
+        page_number = self.get_page_number(request, paginator)
+        try:
+            self.page = paginator.page(page_number)
+        except InvalidPage as exc:
+            raise NotFound(self.invalid_page_message.format(
+                page_number=page_number, message=str(exc)
+            ))
+        if paginator.num_pages > 1 and self.template is not None:
+            self.display_page_controls = True
+        return self.page
+
+
+class RecipeCursorPagination(CursorPagination):
+    page_size = PageLimitPagination.page_size
+    page_size_query_param = 'limit'
+    max_page_size = PageLimitPagination.max_page_size
+    ordering = ('-pub_date', '-id')
+
+
+class RecipePagination(PageLimitPagination):
+    """Номера страниц для фронтенда, курсор — для глубокой прокрутки.
+
+    С параметром ``cursor`` выборка идёт по индексу (pub_date, id) без
+    OFFSET, поэтому время ответа не зависит от глубины страницы.
+    """
+
+    def __init__(self):
+        self.cursor_pagination = RecipeCursorPagination()
+        self.use_cursor = False
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.use_cursor = (
+            self.cursor_pagination.cursor_query_param in request.query_params
+        )
+        if self.use_cursor:
+            return self.cursor_pagination.paginate_queryset(
+                queryset, request, view
+            )
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.use_cursor:
+            return self.cursor_pagination.get_paginated_response(data)
+        return super().get_paginated_response(data)
@@ -0,0 +1,127 @@
+import re
+from itertools import islice
+
+from django.db import connection
+from django.db.models import BooleanField, FloatField, Q
+from django.db.models.expressions import RawSQL
+
+FTS_TABLE = 'recipes_recipe_fts'
+TS_CONFIG = 'russian'
+WORD_RE = re.compile(r'\w+')
+
+# Текст ингредиентов рецепта одной строкой; {alias} — псевдоним рецепта
+INGREDIENT_NAMES_SQL = {
+    'sqlite': (
+        "COALESCE((SELECT group_concat(i.name, ' ') "
+        'FROM recipes_recipeingredient ri '
+        'JOIN recipes_ingredient i ON i.id = ri.ingredient_id '
+        "WHERE ri.recipe_id = {alias}.id), '')"
+    ),
+    'postgresql': (
+        "COALESCE((SELECT string_agg(i.name, ' ') "
+        'FROM recipes_recipeingredient ri '
+        'JOIN recipes_ingredient i ON i.id = ri.ingredient_id '
+        "WHERE ri.recipe_id = {alias}.id), '')"
+    ),
+}
+
+
+def _sqlite_index_sql(where=''):
+    return (
+        f'INSERT INTO {FTS_TABLE} (rowid, name, text, ingredients) '
+        f"SELECT r.id, r.name, r.text, {INGREDIENT_NAMES_SQL['sqlite'].format(alias='r')} "
+        f'FROM recipes_recipe r {where}'
+    )
+
+
+def _postgresql_index_sql(where=''):
+    return (
+        'UPDATE recipes_recipe r SET search_vector = '
+        f"setweight(to_tsvector('{TS_CONFIG}', r.name), 'A') || "
+        f"setweight(to_tsvector('{TS_CONFIG}', "
+        f"{INGREDIENT_NAMES_SQL['postgresql'].format(alias='r')}), 'B') || "
+        f"setweight(to_tsvector('{TS_CONFIG}', r.text), 'C') {where}"
+    )
+
+
+def is_supported():
+    return connection.vendor in INGREDIENT_NAMES_SQL
+
+
+def index_recipes(recipe_ids, chunk_size=500):
+    """Обновляет поисковый индекс для перечисленных рецептов."""
+    if not is_supported():
+        return
+    iterator = iter(recipe_ids)
+    with connection.cursor() as cursor:
+        while chunk := list(islice(iterator, chunk_size)):
+            if connection.vendor == 'postgresql':
+                cursor.execute(
+                    _postgresql_index_sql('WHERE r.id = ANY(%s)'), [chunk]
+                )
+                continue
+            placeholders = ', '.join(['%s'] * len(chunk))
+            cursor.execute(
+                f'DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})', chunk
+            )
+            cursor.execute(
+                _sqlite_index_sql(f'WHERE r.id IN ({placeholders})'), chunk
+            )
+
+
+def remove_recipes(recipe_ids):
+    # В Postgres вектор хранится в самой строке рецепта и удаляется с ней
+    if connection.vendor != 'sqlite' or not recipe_ids:
+        return
+    placeholders = ', '.join(['%s'] * len(recipe_ids))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})',
+            list(recipe_ids)
+        )
+
+
+def rebuild():
+    if not is_supported():
+        return
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute(_postgresql_index_sql())
+        else:
+            cursor.execute(f'DELETE FROM {FTS_TABLE}')
+            cursor.execute(_sqlite_index_sql())
+
+
+def search(queryset, query):
+    """Фильтрует рецепты по запросу и упорядочивает по релевантности.
+
+    Релевантность добавляется через alias, поэтому запрос .values()
+    (RecipeRowSerializer) не получает лишнего столбца.
+    """
+    words = WORD_RE.findall(query)
+    if not words:
+        return queryset
+    if connection.vendor == 'postgresql':
+        tsquery = f"websearch_to_tsquery('{TS_CONFIG}', %s)"
+        return queryset.filter(RawSQL(
+            f'recipes_recipe.search_vector @@ {tsquery}', [query],
+            output_field=BooleanField(),
+        )).alias(search_rank=RawSQL(
+            f'ts_rank(recipes_recipe.search_vector, {tsquery})', [query],
+            output_field=FloatField(),
+        )).order_by('-search_rank')
+    if connection.vendor == 'sqlite':
+        # Каждое слово — префиксный токен в кавычках: спецсимволы FTS5
+        # из пользовательского ввода не интерпретируются
+        match = ' '.join(f'"{word}"*' for word in words)
+        # search_entry__isnull даёт INNER JOIN с таблицей FTS под её именем;
+        # MATCH и bm25 принимают только саму таблицу, не столбец
+        return queryset.filter(search_entry__isnull=False).filter(RawSQL(
+            f'{FTS_TABLE} MATCH %s', [match], output_field=BooleanField(),
+        )).alias(search_rank=RawSQL(
+            f'bm25({FTS_TABLE}, 10.0, 1.0, 5.0)', [], output_field=FloatField(),
+        )).order_by('search_rank')
+    condition = Q()
+    for word in words:
+        condition &= Q(name__icontains=word) | Q(text__icontains=word)
+    return queryset.filter(condition)
@@ -1,23 +1,37 @@
+from collections import defaultdict
+
 from rest_framework import serializers
 from .models import Ingredient, Tag, Recipe, RecipeIngredient, Favorite, ShoppingCart
+from .fields import Base64ImageField
+from .images import schedule_variants
+from . import shopping_list, user_flags
+from .metrics import TimedListSerializer, TimedSerializerMixin, timed
 from django.db import transaction
 from django.contrib.auth import get_user_model
 from djoser.serializers import UserCreateSerializer, UserSerializer, TokenCreateSerializer
-from django.contrib.auth import authenticate
+from .auth import authenticate_by_email
 import logging
 
 logger = logging.getLogger(__name__)
 User = get_user_model()
 
-class IngredientSerializer(serializers.ModelSerializer):
+# Верхние границы — максимумы bigint (id — BigAutoField) и integer
+# (RecipeIngredient.amount): иначе драйвер БД падает с OverflowError и
+# ответ — 500
+MAX_ID = 2**63 - 1
+MAX_AMOUNT = 2**31 - 1
+
+class IngredientSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Ingredient
         fields = ('id', 'name', 'measurement_unit')
+        list_serializer_class = TimedListSerializer
 
-class TagSerializer(serializers.ModelSerializer):
+class TagSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Tag
         fields = ('id', 'name', 'color', 'slug')
+        list_serializer_class = TimedListSerializer
 
 class RecipeIngredientSerializer(serializers.ModelSerializer):
     id = serializers.ReadOnlyField(source='ingredient.id')
@@ -29,30 +43,156 @@ class RecipeIngredientSerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'measurement_unit', 'amount')
 
 class RecipeWriteIngredientSerializer(serializers.ModelSerializer):
-    id = serializers.PrimaryKeyRelatedField(queryset=Ingredient.objects.all(), source='ingredient')
-    amount = serializers.IntegerField()
+    # Существование ингредиентов проверяется одним запросом в
+    # RecipeCreateUpdateSerializer.validate_ingredients
+    id = serializers.IntegerField(min_value=1, max_value=MAX_ID)
+    amount = serializers.IntegerField(min_value=1, max_value=MAX_AMOUNT)
 
     class Meta:
         model = RecipeIngredient
         fields = ('id', 'amount')
 
-class RecipeSerializer(serializers.ModelSerializer):
+class RecipeSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     author = serializers.StringRelatedField(read_only=True)
     ingredients = RecipeIngredientSerializer(source='recipe_ingredients', many=True, read_only=True)
     tags = TagSerializer(many=True, read_only=True)
     image = serializers.ImageField(required=False)
+    is_favorited = serializers.SerializerMethodField()
+    is_in_shopping_cart = serializers.SerializerMethodField()
 
     class Meta:
         model = Recipe
         fields = (
             'id', 'author', 'name', 'image', 'text',
-            'ingredients', 'tags', 'cooking_time', 'pub_date'
+            'ingredients', 'tags', 'cooking_time', 'pub_date',
+            'is_favorited', 'is_in_shopping_cart',
+            'favorites_count', 'shopping_cart_count'
+        )
+        list_serializer_class = TimedListSerializer
+
+    # Флаги — проверка id по множествам пользователя (recipes.user_flags),
+    # загружаемым один раз на запрос, без подзапросов в SQL страницы
+    def get_is_favorited(self, obj):
+        return obj.pk in self.get_user_flags().favorites
+
+    def get_is_in_shopping_cart(self, obj):
+        return obj.pk in self.get_user_flags().shopping_cart
+
+    def get_user_flags(self):
+        request = self.context.get('request')
+        if request is None:
+            return user_flags.EMPTY
+        return user_flags.for_request(request)
+
+class RecipeRowSerializer:
+    """Карточки рецептов из строк .values() — без моделей и полей DRF.
+
+    Выводит ровно то же, что RecipeSerializer, включая порядок ключей и
+    формат дат и картинок. Теги и ингредиенты загружаются кортежами двумя
+    запросами на всю страницу, как prefetch в Recipe.objects.with_related().
+    Только для чтения; включается настройкой RECIPE_ROW_SERIALIZER.
+    """
+
+    values = (
+        'id', 'author__username', 'name', 'image', 'text', 'cooking_time',
+        'pub_date', 'favorites_count', 'shopping_cart_count',
+    )
+    tag_keys = ('id', 'name', 'color', 'slug')
+    ingredient_keys = ('id', 'name', 'measurement_unit', 'amount')
+    pub_date_field = serializers.DateTimeField()
+    image_storage = Recipe._meta.get_field('image').storage
+
+    def __init__(self, instance=None, many=False, context=None, **kwargs):
+        self.instance = instance
+        self.many = many
+        self.context = context or {}
+        self.rows = None
+
+    def related_queries(self, ids):
+        tags = Recipe.tags.through.objects.filter(recipe_id__in=ids).order_by(
+            'tag_id'
+        ).values_list('recipe_id', 'tag_id', 'tag__name', 'tag__color', 'tag__slug')
+        ingredients = RecipeIngredient.objects.filter(recipe_id__in=ids).order_by(
+            'pk'
+        ).values_list(
+            'recipe_id', 'ingredient_id', 'ingredient__name',
+            'ingredient__measurement_unit', 'amount',
         )
+        return tags, ingredients
+
+    def load(self):
+        rows = list(self.instance) if self.many else [self.instance]
+        ids = [row['id'] for row in rows]
+        if ids:
+            self.set_related(rows, *self.related_queries(ids))
+        else:
+            self.set_related(rows, (), ())
+
+    async def aload(self):
+        # instance здесь — уже загруженные строки
+        rows = list(self.instance) if self.many else [self.instance]
+        ids = [row['id'] for row in rows]
+        tags, ingredients = (), ()
+        if ids:
+            tags, ingredients = self.related_queries(ids)
+            tags = [row async for row in tags]
+            ingredients = [row async for row in ingredients]
+        self.set_related(rows, tags, ingredients)
+
+    def set_related(self, rows, tags, ingredients):
+        self.rows = rows
+        self.tags = self.group(tags, self.tag_keys)
+        self.ingredients = self.group(ingredients, self.ingredient_keys)
+
+    @staticmethod
+    def group(related, keys):
+        grouped = defaultdict(list)
+        for recipe_id, *values in related:
+            grouped[recipe_id].append(dict(zip(keys, values)))
+        return grouped
+
+    @property
+    def data(self):
+        if self.rows is None:
+            self.load()
+        request = self.context.get('request')
+        flags = user_flags.EMPTY if request is None else user_flags.for_request(request)
+        with timed('serialize'):
+            items = [self.to_representation(row, request, flags) for row in self.rows]
+        return items if self.many else items[0]
+
+    def to_representation(self, row, request, flags):
+        pk = row['id']
+        # Как serializers.ImageField: абсолютный URL при наличии запроса
+        image = row['image']
+        if image:
+            image = self.image_storage.url(image)
+            if request is not None:
+                image = request.build_absolute_uri(image)
+        else:
+            image = None
+        return {
+            'id': pk,
+            'author': row['author__username'],
+            'name': row['name'],
+            'image': image,
+            'text': row['text'],
+            'ingredients': self.ingredients.get(pk, []),
+            'tags': self.tags.get(pk, []),
+            'cooking_time': row['cooking_time'],
+            'pub_date': self.pub_date_field.to_representation(row['pub_date']),
+            'is_favorited': pk in flags.favorites,
+            'is_in_shopping_cart': pk in flags.shopping_cart,
+            'favorites_count': row['favorites_count'],
+            'shopping_cart_count': row['shopping_cart_count'],
+        }
 
 class RecipeCreateUpdateSerializer(serializers.ModelSerializer):
     ingredients = RecipeWriteIngredientSerializer(many=True)
-    tags = serializers.PrimaryKeyRelatedField(queryset=Tag.objects.all(), many=True)
-    image = serializers.ImageField(required=True)
+    tags = serializers.ListField(
+        child=serializers.IntegerField(min_value=1, max_value=MAX_ID)
+    )
+    image = Base64ImageField(required=True)
 
     class Meta:
         model = Recipe
@@ -64,18 +204,38 @@ class RecipeCreateUpdateSerializer(serializers.ModelSerializer):
     def validate_ingredients(self, value):
         if not value:
             raise serializers.ValidationError('Нужно добавить хотя бы один ингредиент.')
-        ids = [item['ingredient'].id for item in value]
+        ids = [item['id'] for item in value]
         if len(ids) != len(set(ids)):
             raise serializers.ValidationError('Ингредиенты не должны повторяться.')
-        return value
+        ingredients = self._resolve(Ingredient, ids, 'Ингредиент')
+        return [
+            {'ingredient': ingredients[item['id']], 'amount': item['amount']}
+            for item in value
+        ]
+
+    def validate_tags(self, value):
+        tags = self._resolve(Tag, value, 'Тег')
+        return [tags[pk] for pk in dict.fromkeys(value)]
+
+    def _resolve(self, model, ids, label):
+        # Все объекты загружаются одним in_bulk вместо запроса на каждый id
+        objects = model.objects.in_bulk(ids)
+        missing = [pk for pk in ids if pk not in objects]
+        if missing:
+            raise serializers.ValidationError(
+                f'{label} с id={missing[0]} не существует.'
+            )
+        return objects
 
     @transaction.atomic
     def create(self, validated_data):
         ingredients_data = validated_data.pop('ingredients')
         tags = validated_data.pop('tags')
-        recipe = Recipe.objects.create(author=self.context['request'].user, **validated_data)
+        validated_data['author'] = self.context['request'].user
+        recipe = Recipe.objects.create(**validated_data)
         recipe.tags.set(tags)
         self._set_ingredients(recipe, ingredients_data)
+        self._schedule_image_variants(recipe)
         return recipe
 
     @transaction.atomic
@@ -86,12 +246,48 @@ class RecipeCreateUpdateSerializer(serializers.ModelSerializer):
             setattr(instance, attr, value)
         if tags is not None:
             instance.tags.set(tags)
-        if ingredients_data is not None:
-            instance.recipe_ingredients.all().delete()
-            self._set_ingredients(instance, ingredients_data)
+        if ingredients_data is not None and self._update_ingredients(
+            instance, ingredients_data
+        ):
+            shopping_list.recipe_changed(instance.pk)
         instance.save()
+        if 'image' in validated_data:
+            self._schedule_image_variants(instance)
         return instance
 
+    def to_representation(self, instance):
+        # Ответ на запись совпадает с форматом чтения (RecipeList в схеме API)
+        instance = Recipe.objects.with_related().get(pk=instance.pk)
+        return RecipeSerializer(instance, context=self.context).data
+
+    def _schedule_image_variants(self, recipe):
+        # Превью готовятся в фоне после коммита, ответ их не ждёт
+        name = recipe.image.name
+        transaction.on_commit(lambda: schedule_variants(name))
+
+    def _update_ingredients(self, recipe, ingredients_data):
+        # Изменяются только отличающиеся строки: вставка новых, bulk_update
+        # количеств и одно удаление убранных ингредиентов. Возвращает, был
+        # ли изменён состав
+        existing = {item.ingredient_id: item for item in recipe.recipe_ingredients.all()}
+        to_create, to_update = [], []
+        for item in ingredients_data:
+            current = existing.pop(item['ingredient'].id, None)
+            if current is None:
+                to_create.append(item)
+            elif current.amount != item['amount']:
+                current.amount = item['amount']
+                to_update.append(current)
+        if existing:
+            RecipeIngredient.objects.filter(
+                pk__in=[item.pk for item in existing.values()]
+            ).delete()
+        if to_update:
+            RecipeIngredient.objects.bulk_update(to_update, ['amount'])
+        if to_create:
+            self._set_ingredients(recipe, to_create)
+        return bool(existing or to_update or to_create)
+
     def _set_ingredients(self, recipe, ingredients_data):
         RecipeIngredient.objects.bulk_create([
             RecipeIngredient(
@@ -122,20 +318,35 @@ class ShoppingCartSerializer(serializers.ModelSerializer):
         fields = ('id', 'user', 'recipe')
         read_only_fields = ('user', 'recipe')
 
+class RecipeIdsSerializer(serializers.Serializer):
+    # Тело bulk-запросов к избранному и списку покупок
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(min_value=1, max_value=MAX_ID),
+        allow_empty=False,
+        max_length=100,
+    )
+
 class CustomUserCreateSerializer(UserCreateSerializer):
     class Meta(UserCreateSerializer.Meta):
         model = User
         fields = ('email', 'id', 'username', 'first_name', 'last_name', 'password')
 
-class CustomUserSerializer(UserSerializer):
+class CustomUserSerializer(TimedSerializerMixin, UserSerializer):
     is_subscribed = serializers.SerializerMethodField()
 
     class Meta(UserSerializer.Meta):
         model = User
         fields = ('email', 'id', 'username', 'first_name', 'last_name', 'is_subscribed')
+        list_serializer_class = TimedListSerializer
 
     def get_is_subscribed(self, obj):
-        user = self.context.get('request').user
+        # Списки пользователей аннотируют флаг в SQL (UserViewSet.get_queryset)
+        if hasattr(obj, 'is_subscribed'):
+            return bool(obj.is_subscribed)
+        request = self.context.get('request')
+        if request is None:
+            return False
+        user = request.user
         if user.is_anonymous:
             return False
         try:
@@ -143,6 +354,13 @@ class CustomUserSerializer(UserSerializer):
         except AttributeError:
             return False
 
+class UserWithRecipesSerializer(CustomUserSerializer):
+    recipes = ShortRecipeSerializer(source='limited_recipes', many=True, read_only=True)
+    recipes_count = serializers.IntegerField(read_only=True)
+
+    class Meta(CustomUserSerializer.Meta):
+        fields = CustomUserSerializer.Meta.fields + ('recipes', 'recipes_count')
+
 class CustomTokenCreateSerializer(TokenCreateSerializer):
     email = serializers.EmailField(required=True)
     password = serializers.CharField(required=True, style={'input_type': 'password'})
@@ -154,35 +372,15 @@ class CustomTokenCreateSerializer(TokenCreateSerializer):
     def validate(self, attrs):
         email = attrs.get('email')
         password = attrs.get('password')
-        logger.info(f"Validating login for email: {email}")
-
         if not email or not password:
-            logger.error("Email or password missing")
             raise serializers.ValidationError('Необходимо указать email и пароль.')
 
-        try:
-            # Сначала ищем пользователя по email
-            user = User.objects.get(email=email)
-            logger.info(f"Found user with email {email}")
-            
-            # Проверяем пароль
-            if not user.check_password(password):
-                logger.error(f"Invalid password for user {email}")
-                raise serializers.ValidationError({
-                    'non_field_errors': ['Неверный email или пароль.']
-                })
-
-            if not user.is_active:
-                logger.error(f"User {email} is inactive")
-                raise serializers.ValidationError('Пользователь деактивирован.')
-
-            # Если все проверки пройдены, сохраняем пользователя в attrs
-            logger.info(f"Validation successful for user {email}")
-            attrs['user'] = user
-            return attrs
-
-        except User.DoesNotExist:
-            logger.error(f"User with email {email} not found")
+        user = authenticate_by_email(email, password)
+        if user is None:
             raise serializers.ValidationError({
                 'non_field_errors': ['Неверный email или пароль.']
-            }) 
\ No newline at end of file
+            })
+        if not user.is_active:
+            raise serializers.ValidationError('Пользователь деактивирован.')
+        attrs['user'] = user
+        return attrs
@@ -0,0 +1,174 @@
+import csv
+import time
+from itertools import groupby
+from operator import itemgetter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Sum
+
+from . import units
+from .models import Ingredient, RecipeIngredient, ShoppingCart
+
+# Суммы по ингредиентам (версия, {ingredient_id: amount}); названия
+# подставляются при чтении, поэтому переименование ингредиента кеш не портит.
+# Версию меняет каждое изменение корзины: суммы, посчитанные по старому
+# состоянию БД медленным параллельным запросом, с ней уже не совпадут.
+# Версия — целое число, его атомарно увеличивает cache.incr (cart_changed)
+CACHE_KEY = 'shoppinglist:{user_id}'
+VERSION_KEY = 'shoppinglist:{user_id}:version'
+
+
+def get_ttl():
+    return getattr(settings, 'SHOPPING_LIST_CACHE_TTL', 3600)
+
+
+def aggregate(user_id):
+    # Полный пересчёт одним агрегирующим запросом — только при промахе кеша
+    return dict(
+        RecipeIngredient.objects
+        .filter(recipe__in_shopping_carts__user_id=user_id)
+        .values('ingredient_id')
+        .annotate(total=Sum('amount'))
+        .values_list('ingredient_id', 'total')
+    )
+
+
+def get_totals(user_id):
+    key = CACHE_KEY.format(user_id=user_id)
+    version_key = VERSION_KEY.format(user_id=user_id)
+    found = cache.get_many([key, version_key])
+    version, entry = found.get(version_key), found.get(key)
+    if version is not None and entry is not None and entry[0] == version:
+        return entry[1]
+    if version is None:
+        version = time.time_ns()
+        if not cache.add(version_key, version, timeout=get_ttl()):
+            # Версию только что задал другой запрос: не кешируем
+            return aggregate(user_id)
+    # Версия прочитана до пересчёта, поэтому изменение корзины во время
+    # него сделает запись устаревшей, а не подменит новую
+    totals = aggregate(user_id)
+    cache.set(key, (version, totals), timeout=get_ttl())
+    return totals
+
+
+def get_shopping_list(user):
+    """Строки списка покупок, выдаваемые по мере чтения названий из БД.
+
+    Суммы берутся сразу (кеш или один SUM-запрос), а ингредиенты читаются
+    итератором в порядке названия: строки с одним названием и величиной
+    (г и кг, мл и л) идут подряд и сводятся в одну, не собирая весь список
+    в памяти.
+    """
+    totals = get_totals(user.pk)
+    return _rows(totals)
+
+
+def _rows(totals):
+    ingredients = Ingredient.objects.filter(pk__in=totals).order_by(
+        'name', 'pk'
+    ).values_list('pk', 'name', 'measurement_unit')
+    for _, group in groupby(ingredients.iterator(chunk_size=2000), key=itemgetter(1)):
+        group = {pk: (name, unit) for pk, name, unit in group}
+        yield from units.aggregate(group, list(group), [totals[pk] for pk in group])
+
+
+def forget(user_ids):
+    """Делает кешированные суммы пользователей устаревшими.
+
+    Вызывается после коммита изменения рецептов в корзине, а также
+    изменения корзины, если актуальных сумм в кеше не было. Запрос
+    к БД не нужен: список пересчитается при следующем чтении.
+    """
+    version = time.time_ns()
+    cache.set_many(
+        {VERSION_KEY.format(user_id=user_id): version for user_id in user_ids},
+        timeout=get_ttl(),
+    )
+
+
+def cart_changed(user_id, recipe_ids, present):
+    """Переносит изменение корзины в кешированные суммы, не пересчитывая их.
+
+    Вызывается внутри транзакции изменения, пока оно не видно другим
+    запросам: суммы и версия читаются из кеша, к ним прибавляются (или
+    вычитаются) количества ингредиентов изменённых рецептов — один
+    SUM-запрос, только если в кеше есть актуальная запись. После коммита
+    версия увеличивается через cache.incr, и новые суммы записываются,
+    только если incr вернул прочитанную версию + 1, то есть корзину и
+    рецепты в ней никто не менял с момента чтения. Иначе запись остаётся
+    устаревшей и пересчитается при следующем чтении.
+    """
+    key = CACHE_KEY.format(user_id=user_id)
+    version_key = VERSION_KEY.format(user_id=user_id)
+    found = cache.get_many([key, version_key])
+    version, entry = found.get(version_key), found.get(key)
+    if version is None or entry is None or entry[0] != version:
+        transaction.on_commit(lambda: forget([user_id]))
+        return
+    totals = dict(entry[1])
+    sign = 1 if present else -1
+    changed = (
+        RecipeIngredient.objects
+        .filter(recipe_id__in=recipe_ids)
+        .values('ingredient_id')
+        .annotate(total=Sum('amount'))
+        .values_list('ingredient_id', 'total')
+    )
+    for ingredient_id, amount in changed:
+        total = totals.get(ingredient_id, 0) + sign * amount
+        if total > 0:
+            totals[ingredient_id] = total
+        else:
+            totals.pop(ingredient_id, None)
+
+    def apply():
+        try:
+            new_version = cache.incr(version_key)
+        except ValueError:
+            # Версия вытеснена: без неё устаревшую запись не примет и чтение
+            return
+        if new_version == version + 1:
+            cache.set(key, (new_version, totals), timeout=get_ttl())
+    transaction.on_commit(apply)
+
+
+def recipe_changed(recipe_id):
+    # Состав рецепта изменился: сбрасываются только списки, где он есть,
+    # после коммита — иначе параллельное чтение закеширует старые суммы
+    def invalidate():
+        forget(ShoppingCart.objects.filter(
+            recipe_id=recipe_id
+        ).values_list('user_id', flat=True))
+    transaction.on_commit(invalidate)
+
+
+class _Echo:
+    def write(self, value):
+        return value
+
+
+def render_txt(rows):
+    yield 'Список покупок\n\n'
+    for row in rows:
+        if row['amount'] is None:
+            yield f"{row['name']} — {row['measurement_unit']}\n"
+        else:
+            amount = units.format_amount(row['amount'])
+            yield f"{row['name']} ({row['measurement_unit']}) — {amount}\n"
+
+
+def render_csv(rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(['name', 'measurement_unit', 'amount'])
+    for row in rows:
+        amount = '' if row['amount'] is None else row['amount']
+        yield writer.writerow([row['name'], row['measurement_unit'], amount])
+
+
+RENDERERS = {
+    'txt': (render_txt, 'text/plain; charset=utf-8'),
+    'csv': (render_csv, 'text/csv; charset=utf-8'),
+}
@@ -0,0 +1,69 @@
+import string
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import Recipe
+
+ALPHABET = string.digits + string.ascii_letters
+BASE = len(ALPHABET)
+CACHE_KEY = 'shortlink:{code}'
+
+
+def encode(number):
+    code = ''
+    while True:
+        number, remainder = divmod(number, BASE)
+        code = ALPHABET[remainder] + code
+        if not number:
+            return code
+
+
+def decode(code):
+    number = 0
+    for char in code:
+        index = ALPHABET.find(char)
+        if index < 0:
+            raise ValueError(f'Недопустимый символ в коде: {char!r}')
+        number = number * BASE + index
+    # Только канонический код: «0a» и «a» не должны вести на один рецепт
+    if encode(number) != code:
+        raise ValueError(f'Неканонический код: {code!r}')
+    return number
+
+
+def get_code(recipe):
+    return encode(recipe.pk)
+
+
+def resolve(code):
+    """Возвращает путь рецепта во фронтенде или None.
+
+    Сначала общий кеш, при промахе — БД. Кеша процесса нет: удаление
+    рецепта должно сразу действовать во всех воркерах.
+    """
+    target = cache.get(CACHE_KEY.format(code=code))
+    return load(code) if target is None else target
+
+
+async def aresolve(code):
+    # resolve для async-view: промах обрабатывает тот же load в потоке
+    target = await cache.aget(CACHE_KEY.format(code=code))
+    return await sync_to_async(load)(code) if target is None else target
+
+
+def load(code):
+    try:
+        pk = decode(code)
+    except ValueError:
+        return None
+    if not Recipe.objects.filter(pk=pk).exists():
+        return None
+    target = f'/recipes/{pk}/'
+    cache.set(CACHE_KEY.format(code=code), target, timeout=settings.SHORT_LINK_CACHE_TTL)
+    return target
+
+
+def forget(recipe_pk):
+    cache.delete(CACHE_KEY.format(code=encode(recipe_pk)))
@@ -0,0 +1,160 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from .authentication import forget_token
+from . import search
+from . import shopping_list
+from . import user_flags
+from .caching import bump_version
+from .metrics import record_query
+from .shortlinks import forget
+from .models import Favorite, Ingredient, Recipe, ShoppingCart, Tag
+
+COUNTERS = {
+    Favorite: 'favorites_count',
+    ShoppingCart: 'shopping_cart_count',
+}
+# Пакетное удаление, после которого вызывающий код сам вызывает
+# relations_changed один раз на все строки
+deleting_in_bulk = ContextVar('deleting_in_bulk', default=False)
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def ingredient_changed(sender, **kwargs):
+    # После коммита: иначе параллельный запрос успеет закешировать старые
+    # данные уже под новой версией. По ней же перестраивают индекс
+    # автодополнения все процессы (autocomplete.get_index)
+    transaction.on_commit(lambda: bump_version('ingredients'))
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def tag_changed(sender, **kwargs):
+    transaction.on_commit(lambda: bump_version('tags'))
+
+
+def change_counter(model, recipe_ids, delta):
+    # Атомарный UPDATE ... SET x = x ± 1 без чтения строк рецептов
+    field = COUNTERS[model]
+    Recipe.objects.filter(pk__in=recipe_ids).update(
+        **{field: Greatest(F(field) + delta, 0)}
+    )
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_save, sender=ShoppingCart)
+def recipe_relation_created(sender, instance, created, **kwargs):
+    if created:
+        relations_changed(sender, instance.user_id, [instance.recipe_id], True)
+
+
+@receiver(post_delete, sender=Favorite)
+@receiver(post_delete, sender=ShoppingCart)
+def recipe_relation_deleted(sender, instance, **kwargs):
+    if not deleting_in_bulk.get():
+        relations_changed(sender, instance.user_id, [instance.recipe_id], False)
+
+
+@contextmanager
+def bulk_relations_delete():
+    """post_delete избранного и корзины внутри блока не меняют счётчики."""
+    token = deleting_in_bulk.set(True)
+    try:
+        yield
+    finally:
+        deleting_in_bulk.reset(token)
+
+
+def relations_changed(model, user_id, recipe_ids, present):
+    """Обновляет счётчики рецептов и флаги пользователя.
+
+    Вызывается сигналами и напрямую bulk-операциями (bulk_create, удаление
+    в bulk_relations_delete) с id действительно добавленных или удалённых
+    записей.
+    """
+    if not recipe_ids:
+        return
+    change_counter(model, recipe_ids, 1 if present else -1)
+    # Версия флагов меняется после коммита: чтение между изменением и
+    # коммитом иначе закешировало бы старое состояние под новой версией
+    transaction.on_commit(lambda: user_flags.forget([user_id]))
+    if model is ShoppingCart:
+        shopping_list.cart_changed(user_id, recipe_ids, present)
+
+
+@receiver(pre_delete, sender=Recipe)
+def recipe_deleting(sender, instance, **kwargs):
+    # Каскад удаляет ингредиенты рецепта до того, как вычитание из списков
+    # покупок успеет их прочитать, поэтому эти списки просто сбрасываются
+    user_ids = list(ShoppingCart.objects.filter(
+        recipe=instance
+    ).values_list('user_id', flat=True))
+    if user_ids:
+        transaction.on_commit(lambda: shopping_list.forget(user_ids))
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_deleted(sender, instance, **kwargs):
+    forget(instance.pk)
+    search.remove_recipes([instance.pk])
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_saved(sender, instance, **kwargs):
+    # Ингредиенты записываются после сохранения рецепта в той же
+    # транзакции, поэтому индексируем после коммита
+    pk = instance.pk
+    transaction.on_commit(lambda: search.index_recipes([pk]))
+
+
+@receiver(post_save, sender=Ingredient)
+def ingredient_renamed(sender, instance, created, **kwargs):
+    if created:
+        return
+    recipe_ids = Recipe.objects.filter(
+        recipe_ingredients__ingredient=instance
+    ).values_list('id', flat=True)
+    transaction.on_commit(lambda: search.index_recipes(recipe_ids))
+
+
+@receiver(pre_delete, sender=Ingredient)
+def ingredient_deleting(sender, instance, **kwargs):
+    # Каскад удалит строки состава раньше post_delete: рецепты с этим
+    # ингредиентом запоминаются заранее и переиндексируются после коммита
+    recipe_ids = list(Recipe.objects.filter(
+        recipe_ingredients__ingredient=instance
+    ).values_list('id', flat=True))
+    if recipe_ids:
+        transaction.on_commit(lambda: search.index_recipes(recipe_ids))
+
+
+@receiver(post_delete, sender=Token)
+def token_deleted(sender, instance, **kwargs):
+    forget_token(instance.key)
+
+
+@receiver(post_save, sender=get_user_model())
+def user_changed(sender, instance, created, update_fields=None, **kwargs):
+    # В кеше токена лежит is_active: деактивация должна подействовать
+    # сразу, а не через TOKEN_CACHE_TTL
+    if created or update_fields == frozenset({'last_login'}):
+        return
+    for key in Token.objects.filter(user=instance).values_list('key', flat=True):
+        forget_token(key)
+
+
+@receiver(connection_created)
+def install_query_metrics(sender, connection, **kwargs):
+    # Соединение может переподключаться, обёртка ставится один раз
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
@@ -0,0 +1,885 @@
+import base64
+import io
+import re
+import shutil
+import tempfile
+from unittest import skipUnless
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.test import (
+    APIRequestFactory, APITestCase, APITransactionTestCase
+)
+
+from . import (
+    autocomplete, caching, images, search, shopping_list, shortlinks, units,
+    user_flags,
+)
+from .authentication import CachedTokenAuthentication
+from .caching import get_version
+from .filters import RecipeFilter
+from .serializers import RecipeCreateUpdateSerializer
+from .throttling import LoginRateThrottle
+from .models import (
+    Favorite, Ingredient, Recipe, RecipeIngredient, RecipePopularity, ShoppingCart,
+    Subscription, Tag,
+)
+from .signals import bulk_relations_delete
+
+User = get_user_model()
+
+
+def create_recipes(author, count, tags=(), ingredients=()):
+    recipes = []
+    for number in range(count):
+        recipe = Recipe.objects.create(
+            author=author, name=f'Рецепт {number}', text='Описание',
+            cooking_time=10, image='recipes/images/test.gif',
+        )
+        recipe.tags.set(tags)
+        RecipeIngredient.objects.bulk_create([
+            RecipeIngredient(recipe=recipe, ingredient=ingredient, amount=10)
+            for ingredient in ingredients
+        ])
+        recipes.append(recipe)
+    return recipes
+
+
+class RecipeListQueriesTest(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('cook', 'cook@test.com', 'pass')
+        tags = [
+            Tag.objects.create(name=f'Тег {i}', color=f'#00000{i}', slug=f'tag{i}')
+            for i in range(2)
+        ]
+        ingredients = [
+            Ingredient.objects.create(name=f'Ингредиент {i}', measurement_unit='г')
+            for i in range(3)
+        ]
+        recipes = create_recipes(cls.user, 60, tags, ingredients)
+        Favorite.objects.bulk_create([
+            Favorite(user=cls.user, recipe=recipe) for recipe in recipes[::2]
+        ])
+        ShoppingCart.objects.bulk_create([
+            ShoppingCart(user=cls.user, recipe=recipe) for recipe in recipes[::3]
+        ])
+
+    def setUp(self):
+        cache.clear()
+
+    def get_list(self, limit):
+        # Каждый запрос — с холодным кешем флагов пользователя
+        cache.clear()
+        response = self.client.get(f'/api/recipes/?limit={limit}')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['results']), limit)
+        return response
+
+    def assert_constant_queries(self):
+        with CaptureQueriesContext(connection) as context:
+            self.get_list(1)
+        with self.assertNumQueries(len(context)):
+            self.get_list(50)
+
+    def test_anonymous(self):
+        self.assert_constant_queries()
+
+    def test_authenticated(self):
+        # Токен, а не force_authenticate: так же проходят и async-view
+        token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        self.assert_constant_queries()
+        response = self.get_list(50)
+        flags = {item['id']: item['is_favorited'] for item in response.json()['results']}
+        self.assertEqual(
+            {pk for pk, favorited in flags.items() if favorited},
+            set(Favorite.objects.filter(
+                user=self.user, recipe_id__in=flags
+            ).values_list('recipe_id', flat=True)),
+        )
+
+
+class SubscriptionsTest(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('reader', 'reader@test.com', 'pass')
+        cls.authors = [
+            User.objects.create_user(f'author{i}', f'author{i}@test.com', 'pass')
+            for i in range(6)
+        ]
+        for author in cls.authors:
+            create_recipes(author, 4)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_authenticate(self.user)
+
+    def get_page(self, limit):
+        response = self.client.get(
+            f'/api/users/subscriptions/?limit={limit}&recipes_limit=2'
+        )
+        self.assertEqual(response.status_code, 200)
+        return response.json()['results']
+
+    def test_constant_queries(self):
+        Subscription.objects.bulk_create([
+            Subscription(user=self.user, author=author) for author in self.authors
+        ])
+        with CaptureQueriesContext(connection) as context:
+            self.get_page(1)
+        with self.assertNumQueries(len(context)):
+            results = self.get_page(6)
+        self.assertEqual(len(results), 6)
+        for item in results:
+            self.assertTrue(item['is_subscribed'])
+            self.assertEqual(item['recipes_count'], 4)
+            self.assertEqual(len(item['recipes']), 2)
+
+    def test_subscribe_queries(self):
+        author = self.authors[0]
+        url = f'/api/users/{author.pk}/subscribe/'
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.post(url)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.json()['recipes']), 4)
+        # Число запросов не зависит от количества рецептов автора
+        create_recipes(author, 10)
+        Subscription.objects.filter(user=self.user).delete()
+        with self.assertNumQueries(len(context)):
+            self.client.post(url)
+        self.assertEqual(self.client.delete(url).status_code, 204)
+        self.assertEqual(self.client.delete(url).status_code, 400)
+
+    def test_invalid_id(self):
+        for pk in ('abc', str(2**70), '0'):
+            response = self.client.post(f'/api/users/{pk}/subscribe/')
+            self.assertEqual(response.status_code, 404)
+
+
+class RecipeFilterPlanTest(TestCase):
+    FILTERS = ({'author': None}, {'is_favorited': 1}, {'is_in_shopping_cart': 1})
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('cook', 'cook@test.com', 'pass')
+        recipes = create_recipes(cls.user, 20)
+        Favorite.objects.create(user=cls.user, recipe=recipes[0])
+        ShoppingCart.objects.create(user=cls.user, recipe=recipes[1])
+
+    def plans(self):
+        request = APIRequestFactory().get('/api/recipes/')
+        request.user = self.user
+        for params in self.FILTERS:
+            params = {
+                name: self.user.pk if value is None else value
+                for name, value in params.items()
+            }
+            queryset = RecipeFilter(
+                params, queryset=Recipe.objects.all(), request=request
+            ).qs
+            yield params, queryset.explain()
+
+    def test_author_out_of_range(self):
+        for value in (str(2**70), '1.5', 'abc', '0'):
+            response = self.client.get(f'/api/recipes/?author={value}')
+            self.assertEqual(response.status_code, 400, value)
+        response = self.client.get(f'/api/recipes/?author={2**63 - 1}')
+        self.assertEqual(response.json()['results'], [])
+
+    @skipUnless(connection.vendor == 'sqlite', 'План SQLite')
+    def test_sqlite_uses_indexes(self):
+        for params, plan in self.plans():
+            with self.subTest(params=params):
+                self.assertRegex(plan, r'USING (COVERING )?INDEX')
+                # Полный просмотр таблицы — строка SCAN без USING
+                for line in plan.splitlines():
+                    if 'SCAN' in line:
+                        self.assertIn('USING', line, plan)
+                self.assertIsNone(re.search(
+                    r'SCAN (recipes_favorite|recipes_shoppingcart)\b(?! USING)', plan
+                ))
+
+    @skipUnless(connection.vendor == 'postgresql', 'Индексы только для Postgres')
+    def test_postgresql_uses_indexes(self):
+        # На маленьких таблицах Postgres и так выбирает Seq Scan: запрещаем
+        # его, чтобы проверить, что подходящий индекс вообще есть
+        with connection.cursor() as cursor:
+            cursor.execute('SET enable_seqscan = off')
+        try:
+            for params, plan in self.plans():
+                with self.subTest(params=params):
+                    self.assertNotRegex(
+                        plan, r'Seq Scan on (recipes_recipe|recipes_favorite|recipes_shoppingcart)'
+                    )
+        finally:
+            with connection.cursor() as cursor:
+                cursor.execute('SET enable_seqscan = on')
+
+
+class ReferenceCacheTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        Tag.objects.create(name='Завтрак', color='#E26C2D', slug='breakfast')
+
+    def test_renderers_cached_separately(self):
+        json_response = self.client.get('/api/tags/', HTTP_ACCEPT='application/json')
+        html_response = self.client.get('/api/tags/', HTTP_ACCEPT='text/html')
+        self.assertIn('Accept', json_response['Vary'])
+        self.assertNotEqual(json_response['ETag'], html_response['ETag'])
+        self.assertTrue(html_response['Content-Type'].startswith('text/html'))
+        response = self.client.get('/api/tags/', HTTP_ACCEPT='application/json')
+        self.assertTrue(response['Content-Type'].startswith('application/json'))
+
+    def test_version_bumped_after_commit(self):
+        version = get_version('tags')
+        with self.captureOnCommitCallbacks() as callbacks:
+            Tag.objects.create(name='Обед', color='#49B64E', slug='lunch')
+            self.assertEqual(get_version('tags'), version)
+        for callback in callbacks:
+            callback()
+        self.assertNotEqual(get_version('tags'), version)
+
+
+class ShortLinkTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        user = User.objects.create_user('cook', 'cook@test.com', 'pass')
+        self.recipe, = create_recipes(user, 1)
+        self.code = shortlinks.encode(self.recipe.pk)
+
+    def test_redirect(self):
+        response = self.client.get(f'/s/{self.code}/')
+        self.assertRedirects(
+            response, f'/recipes/{self.recipe.pk}/', fetch_redirect_response=False
+        )
+
+    def test_non_canonical_code(self):
+        self.assertEqual(self.client.get(f'/s/0{self.code}/').status_code, 404)
+
+    def test_deleted_recipe(self):
+        self.client.get(f'/s/{self.code}/')
+        self.recipe.delete()
+        self.assertEqual(self.client.get(f'/s/{self.code}/').status_code, 404)
+
+
+class TokenCacheTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('cook', 'cook@test.com', 'pass')
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def get_me(self):
+        return self.client.get('/api/users/me/').status_code
+
+    def test_cached_user_not_shared(self):
+        authentication = CachedTokenAuthentication()
+        first, _ = authentication.authenticate_credentials(self.token.key)
+        second, _ = authentication.authenticate_credentials(self.token.key)
+        self.assertEqual(first, second)
+        self.assertIsNot(first, second)
+
+    def test_cache_holds_no_user_data(self):
+        self.assertEqual(self.get_me(), 200)
+        entry = cache.get(f'authtoken:{self.token.key}')
+        self.assertEqual(entry, {
+            'key': self.token.key, 'user_id': self.user.pk, 'is_active': True,
+        })
+        # Попадание в кеш: профиль читается одним запросом
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/users/me/')
+        self.assertEqual(response.json()['email'], 'cook@test.com')
+        response = self.client.post('/api/users/set_password/', {
+            'current_password': 'pass', 'new_password': 'n3w-Passw0rd!',
+        })
+        self.assertEqual(response.status_code, 204)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.check_password('n3w-Passw0rd!'))
+
+    def test_logout_evicts_token(self):
+        self.assertEqual(self.get_me(), 200)
+        self.token.delete()
+        self.assertEqual(self.get_me(), 401)
+
+    def test_deactivation_evicts_token(self):
+        self.assertEqual(self.get_me(), 200)
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.get_me(), 401)
+
+
+class LoginTest(APITestCase):
+    URL = '/api/auth/token/login/'
+
+    def setUp(self):
+        cache.clear()
+        User.objects.create_user('cook', 'cook@test.com', 'pass')
+
+    def test_login(self):
+        response = self.client.post(
+            self.URL, {'email': 'COOK@test.com', 'password': 'pass'}, format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+
+    @override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+    def test_spoofed_forwarded_for(self):
+        throttle = LoginRateThrottle()
+        limit, _ = throttle.parse_rate(throttle.THROTTLE_RATES['login_ip'])
+        # Клиент подставляет свой X-Forwarded-For, nginx дописывает реальный
+        # IP: смена подставленной части не сбрасывает лимит. Запас в пару
+        # запросов — на случай смены окна посреди теста
+        statuses = [
+            self.client.post(
+                self.URL, {'email': f'user{i}@test.com', 'password': 'x'},
+                format='json', HTTP_X_FORWARDED_FOR=f'10.0.0.{i}, 203.0.113.7',
+            ).status_code
+            for i in range(limit + 3)
+        ]
+        self.assertEqual(statuses[:limit], [400] * limit)
+        self.assertEqual(statuses[-1], 429)
+
+    @override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+    def test_reset(self):
+        throttle = LoginRateThrottle()
+        limit, _ = throttle.parse_rate(throttle.THROTTLE_RATES['login_account'])
+        login = {'email': 'cook@test.com', 'password': 'x'}
+        for _ in range(limit):
+            self.client.post(self.URL, login, format='json')
+        self.assertEqual(self.client.post(self.URL, login, format='json').status_code, 429)
+        throttle.reset(ip='127.0.0.1', email='COOK@test.com')
+        self.assertEqual(self.client.post(self.URL, login, format='json').status_code, 400)
+
+    def test_malformed_body(self):
+        for body in (['x'], 'x', {'email': ['cook@test.com'], 'password': 'pass'}):
+            with self.subTest(body=body):
+                response = self.client.post(self.URL, body, format='json')
+                self.assertEqual(response.status_code, 400)
+
+
+# Прозрачный GIF 1x1
+GIF = (
+    'data:image/gif;base64,'
+    'R0lGODlhAQABAIAAAAAAAP///yH5BAEAAAAALAAAAAABAAEAAAIBRAA7'
+)
+
+
+class RecipeWriteQueriesTest(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('cook', 'cook@test.com', 'pass')
+        cls.tags = [
+            Tag.objects.create(name=f'Тег {i}', color=f'#00000{i}', slug=f'tag{i}')
+            for i in range(3)
+        ]
+        cls.ingredients = Ingredient.objects.bulk_create([
+            Ingredient(name=f'Ингредиент {i}', measurement_unit='г')
+            for i in range(42)
+        ])
+
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media, ignore_errors=True)
+        settings = override_settings(MEDIA_ROOT=media)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        request = APIRequestFactory().post('/api/recipes/')
+        request.user = self.user
+        self.context = {'request': request}
+
+    def payload(self, ingredients, **amounts):
+        return {
+            'name': 'Борщ', 'text': 'Описание', 'cooking_time': 60, 'image': GIF,
+            'tags': [tag.pk for tag in self.tags],
+            'ingredients': [
+                {'id': ingredient.pk, 'amount': amounts.get(str(ingredient.pk), 10)}
+                for ingredient in ingredients
+            ],
+        }
+
+    def save(self, data, instance=None):
+        serializer = RecipeCreateUpdateSerializer(
+            instance, data=data, context=self.context, partial=instance is not None
+        )
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        return serializer.save()
+
+    def test_create(self):
+        # in_bulk ингредиентов и тегов, SAVEPOINT, рецепт, SELECT и INSERT
+        # тегов, все ингредиенты одним INSERT, RELEASE
+        with self.assertNumQueries(8):
+            recipe = self.save(self.payload(self.ingredients[:40]))
+        self.assertEqual(recipe.recipe_ingredients.count(), 40)
+
+    def test_update_diff(self):
+        recipe = self.save(self.payload(self.ingredients[:40]))
+        ingredients = self.ingredients[1:41]
+        changed = ingredients[0]
+        data = self.payload(ingredients, **{str(changed.pk): 20})
+        del data['image']
+        # Сверх неизменного обновления — по одному DELETE, UPDATE и INSERT
+        with self.assertNumQueries(10):
+            self.save(data, recipe)
+        self.assertEqual(
+            dict(recipe.recipe_ingredients.values_list('ingredient_id', 'amount')),
+            {ingredient.pk: 20 if ingredient == changed else 10
+             for ingredient in ingredients},
+        )
+
+    def test_update_unchanged(self):
+        recipe = self.save(self.payload(self.ingredients[:40]))
+        data = self.payload(self.ingredients[:40])
+        del data['image']
+        # in_bulk ×2, SAVEPOINT, теги, строки рецепта, UPDATE рецепта, RELEASE
+        with self.assertNumQueries(7):
+            self.save(data, recipe)
+
+    def test_invalid_ids(self):
+        data = self.payload(self.ingredients[:2])
+        data['ingredients'] += [{'id': 10_000 + i, 'amount': 1} for i in range(40)]
+        data['tags'] = [10_000 + i for i in range(40)]
+        serializer = RecipeCreateUpdateSerializer(data=data, context=self.context)
+        # По одному in_bulk на ингредиенты и теги, независимо от числа id
+        with self.assertNumQueries(2):
+            self.assertFalse(serializer.is_valid())
+        self.assertIn('ingredients', serializer.errors)
+        self.assertIn('tags', serializer.errors)
+
+    def test_out_of_range_values(self):
+        cases = (
+            ('ingredients', [{'id': 2**70, 'amount': 1}]),
+            ('ingredients', [{'id': 0, 'amount': 1}]),
+            ('ingredients', [{'id': self.ingredients[0].pk, 'amount': 0}]),
+            ('ingredients', [{'id': self.ingredients[0].pk, 'amount': 2**40}]),
+            ('tags', [2**70]),
+            ('tags', [-1]),
+        )
+        self.client.force_authenticate(self.user)
+        for field, value in cases:
+            with self.subTest(field=field, value=value):
+                data = {**self.payload(self.ingredients[:1]), field: value}
+                response = self.client.post('/api/recipes/', data, format='json')
+                self.assertEqual(response.status_code, 400)
+                self.assertIn(field, response.json())
+
+    def test_invalid_ids_response(self):
+        data = self.payload(self.ingredients[:2])
+        data['ingredients'] += [{'id': 10_000 + i, 'amount': 1} for i in range(40)]
+        self.client.force_authenticate(self.user)
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.post('/api/recipes/', data, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            sum('FROM "recipes_ingredient"' in query['sql'] for query in context), 1
+        )
+
+
+    def test_image_variants(self):
+        buffer = io.BytesIO()
+        Image.new('RGB', (1000, 500), 'red').save(buffer, format='PNG')
+        data = self.payload(self.ingredients[:1])
+        data['image'] = 'data:image/png;base64,' + base64.b64encode(
+            buffer.getvalue()
+        ).decode()
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe = self.save(data)
+        self.assertTrue(recipe.image.name.startswith('recipes/images/'))
+        # Один фоновый поток: следующая задача выполнится после превью
+        images._executor.submit(lambda: None).result()
+        for width in (320, 640):
+            name = images.variant_name(recipe.image.name, width)
+            with default_storage.open(name) as file, Image.open(file) as image:
+                self.assertEqual((image.format, image.width), ('WEBP', width))
+        # Повторная загрузка того же файла не создаёт копию
+        self.assertEqual(self.save(data).image.name, recipe.image.name)
+
+@skipUnless(search.is_supported(), 'Полнотекстовый поиск только SQLite и Postgres')
+class RecipeSearchTest(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user('cook', 'cook@test.com', 'pass')
+        flour = Ingredient.objects.create(name='мука', measurement_unit='г')
+        cls.in_text, cls.in_name, cls.other = create_recipes(user, 3)
+        cls.in_text.text = 'Мука просеянная'
+        cls.in_text.save()
+        cls.in_name.name = 'Мука блинная'
+        cls.in_name.save()
+        RecipeIngredient.objects.create(recipe=cls.in_name, ingredient=flour, amount=1)
+        # Индекс обновляется после коммита, в TestCase его не будет
+        search.rebuild()
+
+    def setUp(self):
+        cache.clear()
+
+    def test_ranked_by_relevance(self):
+        for row_serializer in (False, True):
+            with self.subTest(row_serializer=row_serializer), override_settings(
+                RECIPE_ROW_SERIALIZER=row_serializer
+            ):
+                response = self.client.get('/api/recipes/?search=мук')
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(
+                    [item['id'] for item in response.json()['results']],
+                    [self.in_name.pk, self.in_text.pk],
+                )
+                self.assertNotIn('search_rank', response.json()['results'][0])
+
+    def test_ingredient_delete_reindexes(self):
+        saffron = Ingredient.objects.create(name='шафран', measurement_unit='г')
+        RecipeIngredient.objects.create(recipe=self.other, ingredient=saffron, amount=1)
+        search.index_recipes([self.other.pk])
+        response = self.client.get('/api/recipes/?search=шафран')
+        self.assertEqual([item['id'] for item in response.json()['results']], [self.other.pk])
+        with self.captureOnCommitCallbacks(execute=True):
+            saffron.delete()
+        response = self.client.get('/api/recipes/?search=шафран')
+        self.assertEqual(response.json()['results'], [])
+
+
+class AutocompleteTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        autocomplete.invalidate_index()
+        Ingredient.objects.bulk_create([
+            Ingredient(name='сахар', measurement_unit='г'),
+        ])
+
+    def test_version_rebuilds_index(self):
+        self.assertEqual([item.name for item in autocomplete.search('са')], ['сахар'])
+        # Изменение из другого процесса: сигналов здесь нет, только новая
+        # версия справочника в общем кеше
+        Ingredient.objects.bulk_create([
+            Ingredient(name='салат', measurement_unit='г'),
+        ])
+        self.assertEqual(len(autocomplete.search('са')), 1)
+        caching.bump_version('ingredients')
+        self.assertEqual(
+            [item.name for item in autocomplete.search('са')], ['салат', 'сахар']
+        )
+
+
+class AsyncHelpersTest(TestCase):
+    # Async-варианты для recipes.async_views должны совпадать с синхронными
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('cook', 'cook@test.com', 'pass')
+        cls.token = Token.objects.create(user=cls.user)
+        cls.recipe, = create_recipes(cls.user, 1)
+
+    def setUp(self):
+        cache.clear()
+
+    async def test_authenticate(self):
+        authentication = CachedTokenAuthentication()
+        request = APIRequestFactory().get(
+            '/', HTTP_AUTHORIZATION=f'Token {self.token.key}'
+        )
+        for _ in range(2):  # промах и попадание в кеш
+            user, token = await authentication.aauthenticate(request)
+            self.assertEqual((user, token), (self.user, self.token))
+        self.assertIsNone(await authentication.aauthenticate(APIRequestFactory().get('/')))
+
+    async def test_resolve(self):
+        code = shortlinks.encode(self.recipe.pk)
+        for _ in range(2):
+            self.assertEqual(
+                await shortlinks.aresolve(code), f'/recipes/{self.recipe.pk}/'
+            )
+        self.assertIsNone(await shortlinks.aresolve('0' + code))
+
+    async def test_version(self):
+        version = await caching.aget_version('tags')
+        self.assertEqual(await caching.aget_version('tags'), version)
+        self.assertEqual(caching.get_version('tags'), version)
+
+
+class RelationsBulkTest(APITestCase):
+    URL = '/api/recipes/favorite/'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('cook', 'cook@test.com', 'pass')
+        cls.recipes = create_recipes(cls.user, 3)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_authenticate(self.user)
+
+    def counts(self):
+        return list(Recipe.objects.order_by('pk').values_list(
+            'favorites_count', flat=True
+        ))
+
+    def test_add_and_remove(self):
+        ids = [recipe.pk for recipe in self.recipes[:2]]
+        response = self.client.post(self.URL, {'recipes': ids}, format='json')
+        self.assertEqual(
+            [item['status'] for item in response.json()['results']],
+            ['added', 'added'],
+        )
+        self.assertEqual(self.counts(), [1, 1, 0])
+        response = self.client.delete(
+            self.URL, {'recipes': [*ids, self.recipes[2].pk, 10**6]}, format='json'
+        )
+        self.assertEqual(
+            [item['status'] for item in response.json()['results']],
+            ['removed', 'removed', 'absent', 'not_found'],
+        )
+        # Каждая удалённая строка вычтена из счётчика ровно один раз
+        self.assertEqual(self.counts(), [0, 0, 0])
+        self.assertFalse(Favorite.objects.exists())
+
+    def test_query_count(self):
+        # В TestCase транзакция — SAVEPOINT и RELEASE, в работе на их месте
+        # BEGIN и аутентификация по токену: число то же, что в query_budget
+        ids = [recipe.pk for recipe in self.recipes]
+        for url in (self.URL, '/api/recipes/shopping_cart/'):
+            with self.subTest(url=url):
+                # Проверка id, INSERT, UPDATE счётчиков
+                with self.assertNumQueries(5):
+                    self.client.post(url, {'recipes': ids}, format='json')
+                # Проверка id, SELECT и DELETE, UPDATE счётчиков
+                with self.assertNumQueries(6):
+                    self.client.delete(url, {'recipes': ids}, format='json')
+                # Менять нечего: только проверка id
+                with self.assertNumQueries(3):
+                    self.client.delete(url, {'recipes': ids}, format='json')
+
+    def test_single_delete_still_counted(self):
+        favorite = Favorite.objects.create(user=self.user, recipe=self.recipes[0])
+        self.assertEqual(self.counts(), [1, 0, 0])
+        favorite.delete()
+        self.assertEqual(self.counts(), [0, 0, 0])
+        with bulk_relations_delete():
+            Favorite.objects.create(user=self.user, recipe=self.recipes[0]).delete()
+        self.assertEqual(self.counts(), [1, 0, 0])
+
+    def test_id_out_of_range(self):
+        response = self.client.post(self.URL, {'recipes': [2**70]}, format='json')
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post(self.URL, {'recipes': [2**63 - 1]}, format='json')
+        self.assertEqual(response.json()['results'][0]['status'], 'not_found')
+
+
+class ShoppingListCacheTest(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('cook', 'cook@test.com', 'pass')
+        cls.sugar = Ingredient.objects.create(name='сахар', measurement_unit='г')
+        cls.recipes = create_recipes(cls.user, 2, ingredients=[cls.sugar])
+        ShoppingCart.objects.create(user=cls.user, recipe=cls.recipes[0])
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_authenticate(self.user)
+
+    def download(self):
+        response = self.client.get('/api/recipes/download_shopping_cart/?type=csv')
+        return b''.join(response.streaming_content).decode()
+
+    def change_cart(self, method):
+        with self.captureOnCommitCallbacks() as callbacks:
+            getattr(self.client, method)(
+                '/api/recipes/shopping_cart/',
+                {'recipes': [self.recipes[1].pk]}, format='json',
+            )
+        # После коммита только incr версии и запись сумм, без запросов к БД
+        with self.assertNumQueries(0):
+            for callback in callbacks:
+                callback()
+
+    def test_cart_change_applies_delta(self):
+        self.assertIn('сахар,г,10', self.download())
+        self.change_cart('post')
+        # Суммы из кеша: читаются только названия ингредиентов
+        with self.assertNumQueries(1):
+            self.assertIn('сахар,г,20', self.download())
+        self.change_cart('delete')
+        with self.assertNumQueries(1):
+            self.assertIn('сахар,г,10', self.download())
+
+    def test_cart_change_without_cache(self):
+        self.change_cart('post')
+        self.assertIn('сахар,г,20', self.download())
+
+    def test_concurrent_changes_invalidate(self):
+        shopping_list.get_totals(self.user.pk)
+        with self.captureOnCommitCallbacks() as first:
+            ShoppingCart.objects.create(user=self.user, recipe=self.recipes[1])
+        # Второе изменение прочитало суммы до коммита первого
+        with self.captureOnCommitCallbacks() as second:
+            shopping_list.cart_changed(self.user.pk, [self.recipes[1].pk], True)
+        for callback in first + second:
+            callback()
+        self.assertEqual(shopping_list.get_totals(self.user.pk), {self.sugar.pk: 20})
+
+    def test_rows_merged_and_ordered(self):
+        recipe = self.recipes[1]
+        for name, unit, amount in (
+            ('яблоки', 'шт', 3), ('мука', 'кг', 1), ('мука', 'г', 500),
+        ):
+            RecipeIngredient.objects.create(
+                recipe=recipe, amount=amount,
+                ingredient=Ingredient.objects.create(name=name, measurement_unit=unit),
+            )
+        ShoppingCart.objects.create(user=self.user, recipe=recipe)
+        rows = shopping_list.get_shopping_list(self.user)
+        self.assertNotIsInstance(rows, list)
+        self.assertEqual(
+            [(row['name'], units.format_amount(row['amount']), row['measurement_unit'])
+             for row in rows],
+            [('мука', '1,5', 'кг'), ('сахар', '20', 'г'), ('яблоки', '3', 'шт.')],
+        )
+
+    def test_stale_reader_does_not_win(self):
+        # Медленный запрос прочитал версию и суммы до изменения корзины,
+        # а записал их уже после
+        shopping_list.get_totals(self.user.pk)
+        version = cache.get(shopping_list.VERSION_KEY.format(user_id=self.user.pk))
+        ShoppingCart.objects.create(user=self.user, recipe=self.recipes[1])
+        shopping_list.forget([self.user.pk])
+        cache.set(
+            shopping_list.CACHE_KEY.format(user_id=self.user.pk),
+            (version, {self.sugar.pk: 10}),
+        )
+        self.assertEqual(shopping_list.get_totals(self.user.pk), {self.sugar.pk: 20})
+
+
+class UserFlagsCacheTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('cook', 'cook@test.com', 'pass')
+        cls.recipe = create_recipes(cls.user, 1)[0]
+
+    def setUp(self):
+        cache.clear()
+
+    def add_favorite(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Favorite.objects.create(user=self.user, recipe=self.recipe)
+
+    def test_change_invalidates(self):
+        self.assertNotIn(self.recipe.pk, user_flags.get(self.user).favorites)
+        self.add_favorite()
+        with self.assertNumQueries(1):
+            self.assertIn(self.recipe.pk, user_flags.get(self.user).favorites)
+        with self.assertNumQueries(0):
+            user_flags.get(self.user)
+
+    def test_stale_reader_does_not_win(self):
+        # Медленное чтение загрузило множества до добавления в избранное,
+        # а записало их уже после
+        user_flags.get(self.user)
+        stale = cache.get_many(user_flags.cache_keys(self.user.pk).values())
+        self.add_favorite()
+        cache.set_many(stale)
+        self.assertIn(self.recipe.pk, user_flags.get(self.user).favorites)
+
+
+@override_settings(QUERY_BUDGET_STRICT=True, SERVER_TIMING_ENABLED=True)
+class QueryBudgetTest(APITransactionTestCase):
+    """Эндпоинты с query_budget при холодном кеше, анонимно и с токеном.
+
+    TransactionTestCase, чтобы транзакции были как в работе (BEGIN, а не
+    SAVEPOINT). Превышение бюджета — QueryBudgetExceeded, а бюджет, который
+    ни разу не достигнут, тоже ошибка: он должен равняться реальному числу.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('cook', 'cook@test.com', 'pass')
+        self.author = User.objects.create_user('author', 'author@test.com', 'pass')
+        self.tag = Tag.objects.create(name='Тег', color='#000000', slug='tag')
+        self.ingredient = Ingredient.objects.create(name='соль', measurement_unit='г')
+        self.recipes = create_recipes(self.author, 3, [self.tag], [self.ingredient])
+        RecipePopularity.objects.bulk_create([
+            RecipePopularity(recipe=recipe, score=recipe.pk) for recipe in self.recipes
+        ])
+        Favorite.objects.create(user=self.user, recipe=self.recipes[0])
+        Subscription.objects.create(user=self.user, author=self.author)
+        self.token = Token.objects.create(user=self.user)
+
+    def requests(self):
+        recipe = self.recipes[0].pk
+        for url in (
+            '/api/users/', f'/api/users/{self.author.pk}/',
+            '/api/users/subscriptions/?recipes_limit=2',
+            '/api/ingredients/', '/api/ingredients/?name=со',
+            f'/api/ingredients/{self.ingredient.pk}/',
+            '/api/tags/', f'/api/tags/{self.tag.pk}/',
+            '/api/recipes/', f'/api/recipes/?tags=tag&author={self.author.pk}',
+            '/api/recipes/?is_favorited=1', f'/api/recipes/{recipe}/',
+            '/api/recipes/trending/',
+        ):
+            yield 'get', url, None
+        for url in ('/api/recipes/favorite/', '/api/recipes/shopping_cart/'):
+            data = {'recipes': [recipe, self.recipes[1].pk]}
+            yield 'post', url, data
+            yield 'delete', url, data
+
+    def test_budgets(self):
+        peaks = {}
+        for authorization in ({}, {'HTTP_AUTHORIZATION': f'Token {self.token.key}'}):
+            self.client.credentials(**authorization)
+            for method, url, data in self.requests():
+                with self.subTest(method=method, url=url, **authorization):
+                    # Холодный кеш: промах и по токену, и по флагам; список
+                    # покупок закеширован, чтобы корзина меняла его суммы
+                    cache.clear()
+                    shopping_list.get_totals(self.user.pk)
+                    response = getattr(self.client, method)(url, data, format='json')
+                    self.assertIn(response.status_code, (200, 401))
+                    budget = response.wsgi_request._query_budget
+                    self.assertIsNotNone(budget)
+                    queries = int(re.search(
+                        r'"(\d+) queries"', response['Server-Timing']
+                    )[1])
+                    view = response.wsgi_request.resolver_match.view_name
+                    peak = peaks.setdefault(view, [0, budget])
+                    peak[0] = max(peak[0], queries)
+        self.assertEqual(
+            {view: queries for view, (queries, _) in peaks.items()},
+            {view: budget for view, (_, budget) in peaks.items()},
+        )
+
+
+class UnitsTest(SimpleTestCase):
+    def aggregate(self, *rows):
+        # rows — (единица, количество) одного ингредиента «сахар»
+        ingredients = {pk: ('сахар', unit) for pk, (unit, _) in enumerate(rows)}
+        return [
+            (units.format_amount(row['amount']), row['measurement_unit'])
+            for row in units.aggregate(
+                ingredients, list(ingredients), [amount for _, amount in rows]
+            )
+        ]
+
+    def test_larger_unit(self):
+        self.assertEqual(self.aggregate(('г', 500), ('кг', 1)), [('1,5', 'кг')])
+        self.assertEqual(self.aggregate(('мл', 250), ('л', 1)), [('1,25', 'л')])
+
+    def test_not_whole_in_larger_unit(self):
+        self.assertEqual(self.aggregate(('г', 1), ('кг', 1)), [('1001', 'г')])
+        self.assertEqual(
+            self.aggregate(('ч. л.', 1), ('ст. л.', 1)), [('4', 'ч. л.')]
+        )
+        self.assertEqual(units.humanize(999, 'mass', 'г'), (999, 'мг'))
+
+    def test_to_taste(self):
+        self.assertEqual(units.humanize(0, 'to_taste', 'по вкусу'), (None, 'по вкусу'))
+        row, = units.aggregate({1: ('соль', 'По вкусу')}, [1, 1], [1, 1])
+        self.assertIsNone(row['amount'])
+        self.assertEqual(row['measurement_unit'], 'по вкусу')
+
+    def test_unknown_unit(self):
+        self.assertEqual(units.humanize(7, 'щепотка', 'Щепотка'), (7, 'Щепотка'))
+        self.assertEqual(
+            self.aggregate(('щепотка', 2), ('Щепотка', 3), ('г', 5)),
+            [('5', 'г'), ('5', 'щепотка')],
+        )
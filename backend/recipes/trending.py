@@ -0,0 +1,85 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from .models import Favorite, RecipePopularity, ShoppingCart
+
+# «Прямое» затухание: вклад события растёт экспоненциально от фиксированной
+# эпохи, поэтому порядок рецептов совпадает с порядком по затухающему
+# рейтингу в любой момент, а старые оценки не нужно пересчитывать —
+# достаточно прибавлять вклад новых событий
+SIGNALS = (
+    (Favorite, 'favorite'),
+    (ShoppingCart, 'shopping_cart'),
+)
+
+
+def event_weight(created, weight):
+    half_life = timedelta(hours=settings.TRENDING_HALF_LIFE_HOURS)
+    return weight * 2 ** ((created - settings.TRENDING_EPOCH) / half_life)
+
+
+def collect_scores(since=None, until=None):
+    scores = defaultdict(float)
+    for model, name in SIGNALS:
+        weight = settings.TRENDING_WEIGHTS[name]
+        events = model.objects.all()
+        if since is not None:
+            events = events.filter(created__gt=since)
+        if until is not None:
+            events = events.filter(created__lte=until)
+        for recipe_id, created in events.values_list('recipe_id', 'created').iterator(chunk_size=10_000):
+            scores[recipe_id] += event_weight(created, weight)
+    return scores
+
+
+@transaction.atomic
+def rebuild(batch_size=5000):
+    now = timezone.now()
+    # Вклад событий старше десяти периодов полураспада пренебрежимо мал
+    horizon = now - timedelta(hours=settings.TRENDING_HALF_LIFE_HOURS * 10)
+    scores = collect_scores(since=horizon, until=now)
+    RecipePopularity.objects.all().delete()
+    RecipePopularity.objects.bulk_create(
+        (
+            RecipePopularity(recipe_id=recipe_id, score=score, refreshed_at=now)
+            for recipe_id, score in scores.items()
+        ),
+        batch_size=batch_size,
+    )
+    return len(scores)
+
+
+@transaction.atomic
+def refresh(batch_size=5000):
+    """Добавляет вклад событий, появившихся после прошлого пересчёта.
+
+    Удалённые из избранного и корзины записи учитывает только rebuild().
+    """
+    watermark = RecipePopularity.objects.aggregate(
+        last=Max('refreshed_at')
+    )['last']
+    if watermark is None:
+        return rebuild(batch_size)
+    now = timezone.now()
+    deltas = collect_scores(since=watermark, until=now)
+    existing = RecipePopularity.objects.in_bulk(list(deltas))
+    to_create = []
+    for recipe_id, delta in deltas.items():
+        row = existing.get(recipe_id)
+        if row is None:
+            to_create.append(
+                RecipePopularity(recipe_id=recipe_id, score=delta, refreshed_at=now)
+            )
+        else:
+            row.score += delta
+            row.refreshed_at = now
+    RecipePopularity.objects.bulk_update(
+        existing.values(), ['score', 'refreshed_at'], batch_size=batch_size
+    )
+    RecipePopularity.objects.bulk_create(to_create, batch_size=batch_size)
+    return len(deltas)
@@ -0,0 +1,116 @@
+"""Суммирование списка покупок с учётом единиц измерения.
+
+measurement_unit ингредиента — произвольная строка («г», «кг», «ч. л.»,
+«по вкусу»...). Единицы одной величины переводятся в её базовую единицу
+и складываются в одну строку списка: 500 г и 1 кг сахара дают 1,5 кг.
+Для вывода сумма записывается в самой крупной единице, где она не меньше
+единицы и укладывается в два знака после запятой. Незнакомые единицы
+складываются только сами с собой.
+"""
+from decimal import Decimal
+
+# Нормализованное написание -> (величина, множитель к базовой единице).
+# Базовые единицы целые (мг, мл, ч. л.), поэтому суммы считаются точно
+UNITS = {
+    'мг': ('mass', 1),
+    'г': ('mass', 1000),
+    'гр': ('mass', 1000),
+    'грамм': ('mass', 1000),
+    'кг': ('mass', 1_000_000),
+    'мл': ('volume', 1),
+    'л': ('volume', 1000),
+    'чл': ('spoon', 1),
+    'стл': ('spoon', 3),
+    'шт': ('count', 1),
+    'повкусу': ('to_taste', 0),
+}
+# Единицы вывода, от крупной к мелкой
+DISPLAY = {
+    'mass': (('кг', 1_000_000), ('г', 1000), ('мг', 1)),
+    'volume': (('л', 1000), ('мл', 1)),
+    'spoon': (('ст. л.', 3), ('ч. л.', 1)),
+    'count': (('шт.', 1),),
+}
+TO_TASTE = 'по вкусу'
+
+
+def normalize(unit):
+    return ''.join(char for char in unit.casefold() if char not in ' .')
+
+
+def parse(unit):
+    """Величина и множитель единицы; незнакомая единица — своя величина."""
+    key = normalize(unit)
+    return UNITS.get(key, (key, 1))
+
+
+def humanize(total, dimension, unit):
+    """Сумма в базовых единицах -> (количество, единица) для вывода."""
+    if dimension == 'to_taste':
+        return None, TO_TASTE
+    ladder = DISPLAY.get(dimension)
+    if ladder is None:
+        return total, unit
+    # Последняя ступень — базовая единица, на ней цикл останавливается всегда
+    for label, factor in ladder:
+        if total >= factor and total * 100 % factor == 0:
+            break
+    if total % factor == 0:
+        return total // factor, label
+    return Decimal(total * 100 // factor).scaleb(-2).normalize(), label
+
+
+def format_amount(amount):
+    # Для людей: десятичная запятая
+    return str(amount).replace('.', ',')
+
+
+class Groups:
+    """Строки итогового списка: ингредиенты с одним названием и величиной."""
+
+    def __init__(self, ingredients):
+        # ingredients — {id: (название, единица)}
+        self.keys = {}
+        self.labels = []
+        self.index = {}
+        parsed = {}
+        for pk, (name, unit) in ingredients.items():
+            if unit not in parsed:
+                parsed[unit] = parse(unit)
+            dimension, factor = parsed[unit]
+            number = self.keys.setdefault((name, dimension), len(self.keys))
+            if number == len(self.labels):
+                self.labels.append((name, dimension, unit))
+            self.index[pk] = (number, factor)
+
+    def sum(self, ingredient_ids, amounts):
+        """Суммы групп в базовых единицах за один проход по строкам.
+
+        ingredient_ids и amounts — параллельные последовательности, id могут
+        повторяться (строки рецептов корзины). Строки с неизвестным id
+        (ингредиент удалён) пропускаются.
+        """
+        totals = [0] * len(self.labels)
+        index = self.index
+        for pk, amount in zip(ingredient_ids, amounts):
+            found = index.get(pk)
+            if found is not None:
+                totals[found[0]] += amount * found[1]
+        return totals
+
+    def rows(self, totals):
+        result = []
+        for (name, dimension, unit), total in zip(self.labels, totals):
+            amount, label = humanize(total, dimension, unit)
+            result.append({'name': name, 'measurement_unit': label, 'amount': amount})
+        result.sort(key=lambda row: (row['name'].casefold(), row['measurement_unit']))
+        return result
+
+
+def aggregate(ingredients, ingredient_ids, amounts):
+    """Список покупок: [{'name', 'measurement_unit', 'amount'}, ...].
+
+    amount — int или Decimal, для «по вкусу» — None.
+    """
+    groups = Groups(ingredients)
+    return groups.rows(groups.sum(ingredient_ids, amounts))
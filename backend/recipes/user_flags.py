@@ -0,0 +1,193 @@
+"""Избранное и список покупок пользователя как множества id рецептов.
+
+Флаги is_favorited / is_in_shopping_cart карточек проверяются принадлежностью
+id этим множествам, а не подзапросами в SQL страницы. Множества лежат в общем
+кеше с версией пользователя; после коммита добавления или удаления версия
+меняется, и при следующем чтении оба множества загружаются одним запросом.
+Чтение, начатое до изменения и записавшее множества после него, оставит их
+со старой версией — такие записи не используются.
+"""
+import time
+from array import array
+from bisect import bisect_left
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import IntegerField, Value
+
+from .models import Favorite, ShoppingCart
+
+CACHE_KEY = 'userflags:{kind}:{user_id}'
+VERSION_KEY = 'userflags:{user_id}:version'
+KINDS = {
+    'favorites': Favorite,
+    'shopping_cart': ShoppingCart,
+}
+
+
+def get_ttl():
+    return getattr(settings, 'USER_FLAGS_CACHE_TTL', 600)
+
+
+class RecipeIdSet:
+    """Отсортированный массив id: 8 байт на рецепт, поиск — бинарный."""
+
+    __slots__ = ('ids',)
+
+    def __init__(self, ids=()):
+        self.ids = array('q', sorted(ids))
+
+    @classmethod
+    def from_bytes(cls, data):
+        instance = cls()
+        instance.ids.frombytes(data)
+        return instance
+
+    def to_bytes(self):
+        return self.ids.tobytes()
+
+    def __contains__(self, recipe_id):
+        index = bisect_left(self.ids, recipe_id)
+        return index < len(self.ids) and self.ids[index] == recipe_id
+
+    def __len__(self):
+        return len(self.ids)
+
+    def add(self, recipe_id):
+        index = bisect_left(self.ids, recipe_id)
+        if index == len(self.ids) or self.ids[index] != recipe_id:
+            self.ids.insert(index, recipe_id)
+
+    def discard(self, recipe_id):
+        index = bisect_left(self.ids, recipe_id)
+        if index < len(self.ids) and self.ids[index] == recipe_id:
+            del self.ids[index]
+
+
+class UserFlags:
+    __slots__ = ('favorites', 'shopping_cart')
+
+    def __init__(self, favorites, shopping_cart):
+        self.favorites = favorites
+        self.shopping_cart = shopping_cart
+
+
+EMPTY = UserFlags(RecipeIdSet(), RecipeIdSet())
+
+
+def cache_keys(user_id):
+    return {kind: CACHE_KEY.format(kind=kind, user_id=user_id) for kind in KINDS}
+
+
+def relations_query(user_id):
+    # Оба множества одним запросом: (recipe_id, номер вида) через UNION ALL
+    kinds = list(KINDS.items())
+    queries = [
+        model.objects.filter(user_id=user_id).annotate(
+            kind=Value(number, output_field=IntegerField())
+        ).values_list('recipe_id', 'kind')
+        for number, (_, model) in enumerate(kinds)
+    ]
+    return queries[0].union(*queries[1:], all=True)
+
+
+def build(rows, user_id, version):
+    ids = {kind: [] for kind in KINDS}
+    names = list(KINDS)
+    for recipe_id, number in rows:
+        ids[names[number]].append(recipe_id)
+    sets = {kind: RecipeIdSet(values) for kind, values in ids.items()}
+    keys = cache_keys(user_id)
+    entries = {
+        keys[kind]: (version, value.to_bytes()) for kind, value in sets.items()
+    }
+    return UserFlags(**sets), entries
+
+
+def lookup_keys(user_id):
+    return [*cache_keys(user_id).values(), VERSION_KEY.format(user_id=user_id)]
+
+
+def from_cache(found, user_id):
+    version = found.get(VERSION_KEY.format(user_id=user_id))
+    sets = {}
+    for kind, key in cache_keys(user_id).items():
+        entry = found.get(key)
+        if version is None or entry is None or entry[0] != version:
+            return None
+        sets[kind] = RecipeIdSet.from_bytes(entry[1])
+    return UserFlags(**sets)
+
+
+def new_version(found, user_id):
+    """Версия, с которой можно закешировать загружаемые множества.
+
+    Прочитанная до загрузки версия или новая, если её не было; None —
+    версию только что задал другой запрос, и результат не кешируется.
+    """
+    version = found.get(VERSION_KEY.format(user_id=user_id))
+    if version is None:
+        version = time.time_ns()
+        if not cache.add(VERSION_KEY.format(user_id=user_id), version, timeout=get_ttl()):
+            return None
+    return version
+
+
+def get(user):
+    if user is None or not user.is_authenticated:
+        return EMPTY
+    found = cache.get_many(lookup_keys(user.pk))
+    flags = from_cache(found, user.pk)
+    if flags is None:
+        version = new_version(found, user.pk)
+        flags, entries = build(relations_query(user.pk), user.pk, version)
+        if version is not None:
+            cache.set_many(entries, timeout=get_ttl())
+    return flags
+
+
+async def aget(user):
+    if user is None or not user.is_authenticated:
+        return EMPTY
+    found = await cache.aget_many(lookup_keys(user.pk))
+    flags = from_cache(found, user.pk)
+    if flags is None:
+        version = found.get(VERSION_KEY.format(user_id=user.pk))
+        if version is None:
+            # Версию задаёт тот же new_version, что и в get, в потоке
+            version = await sync_to_async(new_version)(found, user.pk)
+        rows = [row async for row in relations_query(user.pk)]
+        flags, entries = build(rows, user.pk, version)
+        if version is not None:
+            await cache.aset_many(entries, timeout=get_ttl())
+    return flags
+
+
+def for_request(request):
+    """Флаги пользователя запроса, загружаемые не чаще раза за запрос."""
+    flags = getattr(request, '_user_flags', None)
+    if flags is None:
+        flags = request._user_flags = get(request.user)
+    return flags
+
+
+async def afor_request(request):
+    flags = getattr(request, '_user_flags', None)
+    if flags is None:
+        flags = request._user_flags = await aget(request.user)
+    return flags
+
+
+def forget(user_ids):
+    """Делает кешированные множества пользователей устаревшими.
+
+    Вызывается после коммита изменения избранного или списка покупок:
+    вместо чтения и перезаписи множества (гонка двух изменений) меняется
+    только версия, множества перечитаются при следующем запросе.
+    """
+    version = time.time_ns()
+    cache.set_many(
+        {VERSION_KEY.format(user_id=user_id): version for user_id in user_ids},
+        timeout=get_ttl(),
+    )
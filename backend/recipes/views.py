@@ -1,83 +1,248 @@
 from rest_framework import viewsets, status, permissions
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 from rest_framework.authtoken.models import Token
+from django.conf import settings
+from django.http import (
+    Http404, HttpResponse, HttpResponseForbidden, HttpResponseRedirect,
+    StreamingHttpResponse
+)
 from djoser.views import TokenCreateView, UserViewSet as DjoserUserViewSet
 from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Count, Exists, OuterRef, Prefetch, Value
+from django.urls import reverse
+from django_filters.rest_framework import DjangoFilterBackend
 import logging
 from .serializers import (
-    IngredientSerializer, TagSerializer, RecipeSerializer,
+    IngredientSerializer, TagSerializer, RecipeSerializer, RecipeRowSerializer,
     RecipeCreateUpdateSerializer, FavoriteSerializer,
-    ShoppingCartSerializer, CustomTokenCreateSerializer,
-    CustomUserSerializer
+    ShoppingCartSerializer, CustomTokenCreateSerializer, RecipeIdsSerializer,
+    CustomUserSerializer, UserWithRecipesSerializer
 )
-from .models import Ingredient, Tag, Recipe, Favorite, ShoppingCart
+from .filters import RecipeFilter
+from .models import Ingredient, Tag, Recipe, Favorite, ShoppingCart, Subscription
+from .pagination import PageLimitPagination, RecipePagination
+from .throttling import LoginRateThrottle
+from . import autocomplete, shortlinks
+from .signals import bulk_relations_delete, relations_changed
+from .authentication import stats as token_cache_stats
+from .metrics import registry
+from .caching import CachedResponseMixin
+from .shopping_list import RENDERERS, get_shopping_list
 
 User = get_user_model()
 logger = logging.getLogger(__name__)
 
 class UserViewSet(DjoserUserViewSet):
     serializer_class = CustomUserSerializer
+    query_budget = {'list': 3, 'retrieve': 2, 'subscriptions': 4}
 
     @action(detail=False, methods=['get'])
     def me(self, request):
         if not request.user.is_authenticated:
             return Response(status=status.HTTP_401_UNAUTHORIZED)
-        serializer = self.get_serializer(request.user)
+        # Пользователь из кеша токенов загружен не целиком — читаем профиль
+        # вместе с is_subscribed одним запросом, а не по запросу на поле
+        serializer = self.get_serializer(
+            self.annotate_is_subscribed(User.objects.all()).get(pk=request.user.pk)
+        )
         return Response(serializer.data)
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action in ['list', 'retrieve']:
+            queryset = self.annotate_is_subscribed(queryset).order_by('id')
+        return queryset
+
+    def annotate_is_subscribed(self, queryset):
+        user = self.request.user
+        if not user.is_authenticated:
+            return queryset.annotate(is_subscribed=Value(False))
+        return queryset.annotate(is_subscribed=Exists(
+            Subscription.objects.filter(user=user, author=OuterRef('pk'))
+        ))
+
+    def get_authors_queryset(self):
+        # Рецепты авторов подгружаются одним запросом, ограниченным оконной
+        # функцией до recipes_limit штук на автора
+        recipes = Recipe.objects.order_by('-pub_date', '-id')
+        try:
+            recipes_limit = int(self.request.query_params['recipes_limit'])
+        except (KeyError, ValueError):
+            recipes_limit = None
+        if recipes_limit is not None and recipes_limit >= 0:
+            recipes = recipes[:recipes_limit]
+        return self.annotate_is_subscribed(User.objects.all()).annotate(
+            recipes_count=Count('recipes')
+        ).prefetch_related(
+            Prefetch('recipes', queryset=recipes, to_attr='limited_recipes')
+        )
+
+    @action(
+        detail=False,
+        methods=['get'],
+        permission_classes=[permissions.IsAuthenticated],
+        pagination_class=PageLimitPagination
+    )
+    def subscriptions(self, request):
+        queryset = self.get_authors_queryset().filter(
+            subscribers__user=request.user
+        ).order_by('username')
+        page = self.paginate_queryset(queryset)
+        serializer = UserWithRecipesSerializer(
+            page, many=True, context=self.get_serializer_context()
+        )
+        return self.get_paginated_response(serializer.data)
+
+    @action(
+        detail=True,
+        methods=['post', 'delete'],
+        permission_classes=[permissions.IsAuthenticated]
+    )
+    def subscribe(self, request, id=None):
+        # get_object отвечает 404 и на нечисловой или слишком большой id
+        author = self.get_object()
+
+        if request.method == 'POST':
+            if author == request.user:
+                return Response(
+                    {'errors': 'Нельзя подписаться на самого себя.'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            _, created = Subscription.objects.get_or_create(
+                user=request.user, author=author
+            )
+            if not created:
+                return Response(
+                    {'errors': 'Вы уже подписаны на этого пользователя.'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            serializer = UserWithRecipesSerializer(
+                self.get_authors_queryset().get(pk=author.pk),
+                context=self.get_serializer_context()
+            )
+            return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+        deleted, _ = Subscription.objects.filter(
+            user=request.user, author=author
+        ).delete()
+        if not deleted:
+            return Response(
+                {'errors': 'Вы не подписаны на этого пользователя.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
 class CustomTokenCreateView(TokenCreateView):
     serializer_class = CustomTokenCreateSerializer
+    throttle_classes = [LoginRateThrottle]
 
     def post(self, request, *args, **kwargs):
-        logger.info(f"Login attempt with data: {request.data}")
         serializer = self.get_serializer(data=request.data)
-        try:
-            serializer.is_valid(raise_exception=True)
-            logger.info("Serializer validation passed")
-            return self._action(serializer)
-        except Exception as e:
-            logger.error(f"Login error: {str(e)}")
-            raise
+        if not serializer.is_valid():
+            logger.info('Неудачная попытка входа', extra={
+                'event': 'login_failed',
+                'ip': LoginRateThrottle().get_ident(request),
+            })
+            raise ValidationError(serializer.errors)
+        return self._action(serializer)
 
     def _action(self, serializer):
         user = serializer.validated_data['user']
-        logger.info(f"Creating token for user: {user.email}")
         token, created = Token.objects.get_or_create(user=user)
-        logger.info(f"Token {'created' if created else 'retrieved'}: {token.key}")
+        logger.info('Успешный вход', extra={
+            'event': 'login', 'user_id': user.pk, 'token_created': created
+        })
         return Response({'auth_token': token.key})
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
+class IngredientViewSet(CachedResponseMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
+    cache_group = 'ingredients'
+    query_budget = 2
     permission_classes = [permissions.AllowAny]
     pagination_class = None
 
-    def get_queryset(self):
-        name = self.request.query_params.get('name')
-        queryset = Ingredient.objects.all()
-        if name:
-            return queryset.filter(name__istartswith=name)
-        return queryset
+    def list(self, request, *args, **kwargs):
+        name = request.query_params.get('name')
+        if not name:
+            return super().list(request, *args, **kwargs)
+        serializer = self.get_serializer(autocomplete.search(name), many=True)
+        return Response(serializer.data)
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+class TagViewSet(CachedResponseMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
+    cache_group = 'tags'
+    query_budget = 2
     permission_classes = [permissions.AllowAny]
     pagination_class = None
 
 class RecipeViewSet(viewsets.ModelViewSet):
     queryset = Recipe.objects.all()
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+    pagination_class = RecipePagination
+    # Чтение: аутентификация, COUNT, страница, два prefetch (теги,
+    # ингредиенты) и загрузка флагов пользователя при промахе кеша; в
+    # списке ещё проверка slug из ?tags=. Пакетные избранное и корзина:
+    # аутентификация, BEGIN, проверка id, INSERT или SELECT и DELETE (у
+    # моделей есть post_delete, быстрого удаления нет) и UPDATE счётчиков;
+    # у корзины ещё SUM ингредиентов для закешированного списка покупок.
+    # Бюджеты проверяет tests.QueryBudgetTest
+    query_budget = {
+        'list': 7, 'retrieve': 5, 'trending': 5,
+        'favorite_bulk': 6, 'shopping_cart_bulk': 7,
+    }
+    filter_backends = [DjangoFilterBackend]
+    filterset_class = RecipeFilter
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action in ['list', 'retrieve', 'trending']:
+            if self.use_row_serializer():
+                return queryset.values(*RecipeRowSerializer.values)
+            queryset = queryset.with_related()
+        return queryset
     
     def get_serializer_class(self):
         if self.action in ['create', 'update', 'partial_update']:
             return RecipeCreateUpdateSerializer
+        if self.action in ['list', 'retrieve', 'trending'] and self.use_row_serializer():
+            return RecipeRowSerializer
         return RecipeSerializer
 
+    def use_row_serializer(self):
+        # Только для JSON: browsable API строит формы по экземплярам моделей
+        renderer = getattr(self.request, 'accepted_renderer', None)
+        return (
+            settings.RECIPE_ROW_SERIALIZER
+            and renderer is not None and renderer.format == 'json'
+        )
+
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
 
+    @action(detail=False, methods=['get'])
+    def trending(self, request):
+        # Упорядоченное чтение по индексу RecipePopularity.score
+        try:
+            limit = min(int(request.query_params.get('limit', 10)), 50)
+        except ValueError:
+            limit = 10
+        queryset = self.get_queryset().filter(
+            popularity__isnull=False
+        ).order_by('-popularity__score')[:max(limit, 0)]
+        serializer = self.get_serializer(queryset, many=True)
+        return Response(serializer.data)
+
+    @action(detail=True, methods=['get'], url_path='get-link')
+    def get_link(self, request, pk=None):
+        recipe = self.get_object()
+        path = reverse('short_link', args=[shortlinks.get_code(recipe)])
+        return Response({'short-link': request.build_absolute_uri(path)})
+
     @action(detail=True, methods=['post', 'delete'])
     def favorite(self, request, pk=None):
         recipe = self.get_object()
@@ -108,4 +273,96 @@ class RecipeViewSet(viewsets.ModelViewSet):
                           else status.HTTP_200_OK)
         
         ShoppingCart.objects.filter(user=request.user, recipe=recipe).delete()
-        return Response(status=status.HTTP_204_NO_CONTENT) 
\ No newline at end of file
+        return Response(status=status.HTTP_204_NO_CONTENT) 
+
+    @action(detail=False, methods=['post', 'delete'], url_path='favorite')
+    def favorite_bulk(self, request):
+        return self.change_relations(Favorite, request)
+
+    @action(detail=False, methods=['post', 'delete'], url_path='shopping_cart')
+    def shopping_cart_bulk(self, request):
+        return self.change_relations(ShoppingCart, request)
+
+    @transaction.atomic
+    def change_relations(self, model, request):
+        # Пакетное добавление или удаление: проверка id и текущего состояния
+        # одним запросом, затем один INSERT или DELETE ... IN
+        serializer = RecipeIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = list(dict.fromkeys(serializer.validated_data['recipes']))
+        relations = model.objects.filter(user=request.user)
+        present = dict(
+            Recipe.objects.filter(pk__in=ids).annotate(present=Exists(
+                relations.filter(recipe=OuterRef('pk'))
+            )).values_list('pk', 'present')
+        )
+        adding = request.method == 'POST'
+        changed = [pk for pk in ids if present.get(pk) == (not adding)]
+        if adding:
+            # Запись, добавленную параллельным запросом, пропускает
+            # ignore_conflicts; расхождение счётчика чинит recount_counters
+            model.objects.bulk_create(
+                [model(user=request.user, recipe_id=pk) for pk in changed],
+                ignore_conflicts=True,
+            )
+        elif changed:
+            # post_delete по каждой строке не трогает счётчики и флаги:
+            # их обновляет один вызов relations_changed ниже
+            with bulk_relations_delete():
+                relations.filter(recipe_id__in=changed).delete()
+        relations_changed(model, request.user.pk, changed, adding)
+
+        statuses = ('added', 'exists') if adding else ('removed', 'absent')
+        results = []
+        for pk in ids:
+            if pk not in present:
+                result = 'not_found'
+            else:
+                result = statuses[0] if pk in changed else statuses[1]
+            results.append({'id': pk, 'status': result})
+        return Response({'results': results})
+
+    @action(
+        detail=False,
+        methods=['get'],
+        permission_classes=[permissions.IsAuthenticated]
+    )
+    def download_shopping_cart(self, request):
+        # Параметр `format` зарезервирован DRF, поэтому формат файла — `type`
+        file_type = request.query_params.get('type', 'txt')
+        if file_type not in RENDERERS:
+            return Response(
+                {'type': f'Допустимые значения: {", ".join(RENDERERS)}.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        render, content_type = RENDERERS[file_type]
+        rows = get_shopping_list(request.user)
+        response = StreamingHttpResponse(render(rows), content_type=content_type)
+        response['Content-Disposition'] = (
+            f'attachment; filename="shopping_list.{file_type}"'
+        )
+        return response
+
+
+def short_link_redirect(request, code):
+    # Обычная Django-view без DRF: горячий путь — одно обращение к кешу
+    target = shortlinks.resolve(code)
+    if target is None:
+        raise Http404('Рецепт не найден.')
+    return HttpResponseRedirect(target)
+
+
+def metrics_view(request):
+    # Формат Prometheus; метрики накапливаются в каждом процессе отдельно
+    allowed = request.META.get('REMOTE_ADDR') in settings.METRICS_ALLOWED_IPS
+    if not allowed and not request.user.is_staff:
+        return HttpResponseForbidden()
+    auth = token_cache_stats.snapshot()
+    extra = [
+        ('token_cache_hits_total', 'counter', auth['hits']),
+        ('token_cache_misses_total', 'counter', auth['misses']),
+        ('token_cache_hit_ratio', 'gauge', auth['hit_ratio']),
+    ]
+    return HttpResponse(
+        registry.render(extra), content_type='text/plain; version=0.0.4'
+    )